@@ -0,0 +1,23 @@
+"""
+HTTP settings shared by the GenAI clients (planner and completion detector).
+"""
+
+from typing import Dict, Any
+import httpx
+
+try:
+    import h2  # noqa: F401  Optional: enables HTTP/2 in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def http_client_args() -> Dict[str, Any]:
+    """
+    httpx client settings for the GenAI client: a warm keep-alive pool so
+    back-to-back requests reuse the TLS connection, HTTP/2 when h2 is installed.
+    """
+    return {
+        "limits": httpx.Limits(max_keepalive_connections=16, max_connections=32, keepalive_expiry=300.0),
+        "http2": HTTP2_AVAILABLE,
+    }
@@ -6,6 +6,7 @@ All methods return (success: bool, result: Any, error: str).
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import os
 from typing import Tuple, Any, Optional, List
 import time
@@ -38,18 +39,42 @@ class RPCClient:
         self.port = port
         self.timeout = timeout
         self.rpc_url = f"http://{ip_address}:{port}/"
+        
+        # One persistent keep-alive connection for all calls (no TCP handshake per action)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
     
-    def _call(self, method: str, params: List[Any] = None) -> Tuple[bool, Any, str]:
+    def warmup(self) -> bool:
+        """
+        Open the connection ahead of the first action (with a harmless read-only call).
+        
+        Returns:
+            True if the robot answered
+        """
+        success, _, _ = self.get_battery_voltage()
+        return success
+    
+    def close(self):
+        """Close the persistent connection."""
+        self.session.close()
+    
+    def _call(self, method: str, params: List[Any] = None,
+              timeout: Optional[float] = None) -> Tuple[bool, Any, str]:
         """
         Internal method to make JSON-RPC 2.0 call.
         
         Args:
             method: RPC method name
             params: Method parameters (list)
+            timeout: Request timeout in seconds (default: self.timeout)
         
         Returns:
             (success: bool, result: Any, error: str)
         """
+        if timeout is None:
+            timeout = self.timeout
         if params is None:
             params = []
         
@@ -61,11 +86,10 @@ class RPCClient:
         }
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 self.rpc_url,
                 json=payload,
-                headers={"Content-Type": "application/json"},
-                timeout=self.timeout
+                timeout=timeout
             )
             
             if response.status_code == 200:
@@ -88,7 +112,7 @@ class RPCClient:
                 return (False, None, f"HTTP {response.status_code}: {response.text}")
         
         except requests.exceptions.Timeout:
-            return (False, None, f"Request timeout after {self.timeout}s")
+            return (False, None, f"Request timeout after {timeout}s")
         except requests.exceptions.ConnectionError as e:
             error_str = str(e)
             # Provide helpful diagnostic information
@@ -250,14 +274,17 @@ class RPCClient:
         """
         return self._call("GetMecanumStatus", [])
     
-    def reset_mecanum_motors(self) -> Tuple[bool, Any, str]:
+    def reset_mecanum_motors(self, timeout: Optional[float] = None) -> Tuple[bool, Any, str]:
         """
         Stop all motors and reset base state.
         
+        Args:
+            timeout: Request timeout in seconds (default: the client timeout)
+        
         Returns:
             (success: bool, result: Any, error: str)
         """
-        return self._call("ResetMecanumMotors", [])
+        return self._call("ResetMecanumMotors", [], timeout=timeout)
     
     # ========== Sensor Operations ==========
     
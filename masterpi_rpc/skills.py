@@ -5,11 +5,15 @@ All skills enforce maximum duration, validate parameters, and return
 (success: bool, result: dict, error: str).
 """
 
+import logging
 import time
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, Optional
 from .rpc_client import RPCClient
 from .safety import SafetyLimits, ActionTimeout
 
+# Per-call diagnostics: a child of the executor's console trace, shown at DEBUG (--verbose)
+skills_logger = logging.getLogger("executor.skills")
+
 
 class RobotSkills:
     """Short-step skill wrappers for safe robot control."""
@@ -76,14 +80,17 @@ class RobotSkills:
             "elapsed": elapsed
         }, "")
     
-    def base_stop(self) -> Tuple[bool, Dict[str, Any], str]:
+    def base_stop(self, timeout: Optional[float] = None) -> Tuple[bool, Dict[str, Any], str]:
         """
         Explicitly stop base movement.
         
+        Args:
+            timeout: RPC timeout in seconds (default: the client timeout)
+        
         Returns:
             (success: bool, result: dict, error: str)
         """
-        success, result, error = self.rpc.reset_mecanum_motors()
+        success, result, error = self.rpc.reset_mecanum_motors(timeout=timeout)
         return (success, {"action": "base_stop"}, error)
     
     def arm_move_xyz(self, x: float, y: float, z: float, pitch: float = 0.0,
@@ -121,14 +128,15 @@ class RobotSkills:
         
         elapsed = time.time() - self.timeout.start_time if self.timeout.start_time else 0.0
         
-        # Debug: Print RPC result to help diagnose issues
-        if result:
-            print(f"  → RPC returned: success={success}, result type={type(result)}")
+        # Debug: Log RPC result to help diagnose issues
+        if result and skills_logger.isEnabledFor(logging.DEBUG):
+            lines = [f"  → RPC returned: success={success}, result type={type(result)}"]
             if isinstance(result, list) and len(result) >= 2:
                 # RPC returns [True, [servo_angles, ...], 'ArmMoveIk']
                 ik_success = result[0] if len(result) > 0 else False
                 servo_data = result[1] if len(result) > 1 else None
-                print(f"  → IK success: {ik_success}, servo data: {servo_data}")
+                lines.append(f"  → IK success: {ik_success}, servo data: {servo_data}")
+            skills_logger.debug("\n".join(lines))
         
         if success:
             return (True, {
@@ -180,9 +188,9 @@ class RobotSkills:
         # Typical arm movement: ~20cm max distance, at 1500ms speed ≈ 2-3 seconds
         # Add extra margin for safety
         wait_time = 3.0  # seconds
-        print(f"  → Waiting {wait_time:.1f}s for arm movement to complete...")
+        skills_logger.debug("  → Waiting %.1fs for arm movement to complete...", wait_time)
         time.sleep(wait_time)
-        print(f"  → Wait complete")
+        skills_logger.debug("  → Wait complete")
         
         return (True, {
             **result,
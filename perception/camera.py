@@ -9,6 +9,7 @@ import urllib.request
 import numpy as np
 import time
 import os
+import threading
 from typing import Tuple, Optional
 from dotenv import load_dotenv
 
@@ -19,7 +20,8 @@ load_dotenv()
 class Camera:
     """MJPEG stream camera capture."""
     
-    def __init__(self, ip_address: str = None, port: int = None, timeout: int = 10):
+    def __init__(self, ip_address: str = None, port: int = None, timeout: int = 10,
+                 background_reader: bool = False):
         """
         Initialize camera.
         
@@ -27,6 +29,9 @@ class Camera:
             ip_address: Robot IP address (default: from .env ROBOT_IP)
             port: Camera stream port (default: from .env CAMERA_PORT)
             timeout: Connection timeout in seconds
+            background_reader: Keep one MJPEG connection open and read it on a daemon
+                               thread; get_frame() then returns the next frame to arrive
+                               instead of opening a fresh stream per call
         """
         if ip_address is None:
             ip_address = os.getenv("ROBOT_IP")
@@ -40,8 +45,19 @@ class Camera:
         self.timeout = timeout
         self.camera_url = f"http://{ip_address}:{port}/"
         self.stream: Optional[urllib.request.URLopener] = None
+        # Read-only (flags.writeable=False): returned frames are shared, not copied
         self.latest_frame: Optional[np.ndarray] = None
         self.latest_timestamp: float = 0.0
+        
+        # Background reader state: newest undecoded JPEG and its arrival time (under _jpeg_cond).
+        # Frames are only decoded when get_frame() asks for one.
+        self._jpeg_cond = threading.Condition()
+        self._latest_jpeg: Optional[bytes] = None
+        self._latest_jpeg_time = 0.0
+        self._reader_stop = threading.Event()
+        self._reader_thread: Optional[threading.Thread] = None
+        if background_reader:
+            self.start_reader()
     
     def _open_stream(self) -> bool:
         """Open MJPEG stream connection."""
@@ -52,16 +68,131 @@ class Camera:
             print(f"Failed to open camera stream: {e}")
             return False
     
-    def get_frame(self) -> Tuple[bool, Optional[np.ndarray], float]:
+    def start_reader(self):
+        """Start the background MJPEG reader thread (no-op if already running)."""
+        if self._reader_thread is not None and self._reader_thread.is_alive():
+            return
+        self._reader_stop.clear()
+        self._reader_thread = threading.Thread(target=self._reader_loop, name="camera-reader", daemon=True)
+        self._reader_thread.start()
+    
+    def _reader_loop(self):
+        """Read the MJPEG stream continuously, keeping only the newest complete JPEG."""
+        while not self._reader_stop.is_set():
+            try:
+                stream = urllib.request.urlopen(self.camera_url, timeout=self.timeout)
+            except Exception as e:
+                print(f"Camera reader: failed to open stream: {e}")
+                self._reader_stop.wait(1.0)
+                continue
+            
+            bytes_data = b""
+            # read1 returns whatever has arrived instead of blocking for the full size
+            read = getattr(stream, "read1", stream.read)
+            try:
+                while not self._reader_stop.is_set():
+                    chunk = read(65536)
+                    if not chunk:
+                        break  # Stream ended, reconnect
+                    bytes_data += chunk
+                    
+                    # Extract every complete JPEG in the buffer; keep only the newest
+                    jpg_data = None
+                    while True:
+                        start_marker = bytes_data.find(b'\xff\xd8')
+                        if start_marker == -1:
+                            bytes_data = bytes_data[-1:]  # Keep a possible split marker byte
+                            break
+                        end_marker = bytes_data.find(b'\xff\xd9', start_marker + 2)
+                        if end_marker == -1:
+                            bytes_data = bytes_data[start_marker:]
+                            break
+                        jpg_data = bytes_data[start_marker:end_marker + 2]
+                        bytes_data = bytes_data[end_marker + 2:]
+                    
+                    if jpg_data is not None:
+                        with self._jpeg_cond:
+                            self._latest_jpeg = jpg_data
+                            self._latest_jpeg_time = time.time()
+                            self._jpeg_cond.notify_all()
+                    
+                    # If we have too much data without finding markers, reset
+                    if len(bytes_data) > 500000:  # ~500KB
+                        bytes_data = bytes_data[-250000:]  # Keep last 250KB
+            except Exception as e:
+                print(f"Camera reader: stream read error: {e}")
+            finally:
+                try:
+                    stream.close()
+                except:
+                    pass
+            self._reader_stop.wait(0.2)
+    
+    @property
+    def reader_running(self) -> bool:
+        """Whether the background MJPEG reader thread is running."""
+        return self._reader_thread is not None and self._reader_thread.is_alive()
+    
+    def _get_reader_frame(self, require_new: bool = True) -> Tuple[bool, Optional[np.ndarray], float]:
+        """
+        Get a frame from the background reader and decode it.
+        
+        Args:
+            require_new: Wait for the next frame (arriving after this call); if False,
+                         return the newest frame already received (waits only if none has)
+        """
+        requested = time.time()
+        with self._jpeg_cond:
+            if require_new or self._latest_jpeg is None:
+                self._jpeg_cond.wait_for(lambda: self._latest_jpeg_time >= requested, timeout=self.timeout)
+            jpg_data, timestamp = self._latest_jpeg, self._latest_jpeg_time
+        
+        if jpg_data is None or (require_new and timestamp < requested):
+            print("Warning: Camera reader produced no new frame")
+            if self.latest_frame is not None:
+                print("  → Using cached frame as fallback")
+                return (True, self.latest_frame, self.latest_timestamp)
+            return (False, None, requested)
+        
+        # Already decoded (no newer JPEG since the last call)
+        if timestamp == self.latest_timestamp and self.latest_frame is not None:
+            return (True, self.latest_frame, self.latest_timestamp)
+        
+        image = cv2.imdecode(np.frombuffer(jpg_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            print("Warning: Failed to decode camera frame")
+            if self.latest_frame is not None:
+                return (True, self.latest_frame, self.latest_timestamp)
+            return (False, None, timestamp)
+        image.flags.writeable = False
+        self.latest_frame = image
+        self.latest_timestamp = timestamp
+        return (True, image, timestamp)
+    
+    def get_frame(self, require_new: bool = True) -> Tuple[bool, Optional[np.ndarray], float]:
         """
         Capture a single frame from the MJPEG stream.
         
+        The returned frame is read-only (it is also kept as latest_frame);
+        copy it before drawing on it.
+        
         Uses the same approach as camera_snapshot.py: open a fresh stream,
-        read until we find a complete JPEG frame, then close.
+        read until we find a complete JPEG frame, then close. With the
+        background reader running, waits for the next frame it receives instead.
+        
+        Args:
+            require_new: If False, a frame that has already arrived is good enough:
+                         the newest one from the background reader, or latest_frame
+                         without the reader (a capture only happens if there is none)
         
         Returns:
             (success: bool, frame: np.ndarray or None, timestamp: float)
         """
+        if self.reader_running:
+            return self._get_reader_frame(require_new)
+        if not require_new and self.latest_frame is not None:
+            return (True, self.latest_frame, self.latest_timestamp)
+        
         timestamp = time.time()
         
         try:
@@ -82,7 +213,7 @@ class Camera:
                 # If we have cached frame, return it as fallback
                 if self.latest_frame is not None:
                     print("  → Using cached frame as fallback")
-                    return (True, self.latest_frame.copy(), self.latest_timestamp)
+                    return (True, self.latest_frame, self.latest_timestamp)
                 return (False, None, timestamp)
             
             bytes_data = bytes()
@@ -102,7 +233,7 @@ class Camera:
                     # If we have cached frame, return it as fallback
                     if self.latest_frame is not None:
                         print("  → Using cached frame as fallback")
-                        return (True, self.latest_frame.copy(), self.latest_timestamp)
+                        return (True, self.latest_frame, self.latest_timestamp)
                     return (False, None, timestamp)
                 
                 if not chunk:
@@ -114,7 +245,7 @@ class Camera:
                     # If we have cached frame, return it as fallback
                     if self.latest_frame is not None:
                         print("  → Stream ended, using cached frame as fallback")
-                        return (True, self.latest_frame.copy(), self.latest_timestamp)
+                        return (True, self.latest_frame, self.latest_timestamp)
                     return (False, None, timestamp)
                 
                 bytes_data += chunk
@@ -139,6 +270,7 @@ class Camera:
                     image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
                     
                     if image is not None:
+                        image.flags.writeable = False
                         self.latest_frame = image
                         self.latest_timestamp = timestamp
                         return (True, image, timestamp)
@@ -161,7 +293,7 @@ class Camera:
             
             if self.latest_frame is not None:
                 print(f"Warning: Could not read new frame after {max_iterations} iterations, using cached frame")
-                return (True, self.latest_frame.copy(), self.latest_timestamp)
+                return (True, self.latest_frame, self.latest_timestamp)
             
             print(f"Warning: Failed to capture frame after {max_iterations} iterations")
             return (False, None, timestamp)
@@ -172,7 +304,7 @@ class Camera:
             # If we have cached frame, return it as fallback
             if self.latest_frame is not None:
                 print("  → Using cached frame as fallback")
-                return (True, self.latest_frame.copy(), self.latest_timestamp)
+                return (True, self.latest_frame, self.latest_timestamp)
             return (False, None, timestamp)
         except Exception as e:
             print(f"Unexpected camera error: {e}")
@@ -180,7 +312,7 @@ class Camera:
             # If we have cached frame, return it as fallback
             if self.latest_frame is not None:
                 print("  → Using cached frame as fallback")
-                return (True, self.latest_frame.copy(), self.latest_timestamp)
+                return (True, self.latest_frame, self.latest_timestamp)
             return (False, None, timestamp)
     
     def get_latest_frame(self) -> Tuple[bool, Optional[np.ndarray], float]:
@@ -190,13 +322,14 @@ class Camera:
         Returns:
             (success: bool, frame: np.ndarray or None, timestamp: float)
         """
-        if self.latest_frame is not None:
-            return (True, self.latest_frame.copy(), self.latest_timestamp)
-        else:
-            return self.get_frame()
+        return self.get_frame(require_new=False)
     
     def close(self):
-        """Close camera stream."""
+        """Close camera stream (and stop the background reader)."""
+        if self._reader_thread is not None:
+            self._reader_stop.set()
+            self._reader_thread.join(timeout=self.timeout + 1)
+            self._reader_thread = None
         if self.stream is not None:
             try:
                 self.stream.close()
@@ -5,58 +5,128 @@ Uses a lightweight model to quickly determine if the current task has been compl
 """
 
 import os
+from functools import lru_cache
 from typing import Dict, Any, Optional
 from google import genai
-from PIL import Image
-import io
 import numpy as np
 import cv2
 from dotenv import load_dotenv
 
+from genai_http import http_client_args
+
 # Load environment variables
 load_dotenv()
 
+_COMPLETION_PROMPT_TEMPLATE = """You are a task completion checker for a robot.
+
+Current task: {task_description}
+
+Last action: {last_action}
+
+Look at the image and determine if the task has been completed. 
+
+Return your answer in this exact JSON format:
+{{
+    "completed": true or false,
+    "confidence": 0.0 to 1.0,
+    "reason": "brief explanation",
+    "evidence": "what you see in the image that supports your conclusion"
+}}
+
+Be strict - the task is only completed if it is clearly and fully done. If uncertain, return completed=false."""
+
+
+@lru_cache(maxsize=64)
+def _completion_prompt(task_description: str, last_action: Optional[str]) -> str:
+    """Completion-check prompt (the task is fixed per run and actions repeat, so it is cached)."""
+    return _COMPLETION_PROMPT_TEMPLATE.format(
+        task_description=task_description,
+        last_action=last_action if last_action else "None"
+    )
+
+
+@lru_cache(maxsize=64)
+def _completion_prompt_part(task_description: str, last_action: Optional[str]):
+    """The completion-check prompt as a Part (reused across checks; the SDK does not modify it)."""
+    from google.genai import types
+    return types.Part.from_text(text=_completion_prompt(task_description, last_action))
+
 
 class TaskDetector:
     """Detects task completion using Gemini 3 Flash Preview."""
     
-    def __init__(self):
-        """Initialize task detector with Gemini 3 Flash."""
-        # Get API key
-        api_key = os.environ.get("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable not set")
+    def __init__(self, client: Optional[genai.Client] = None):
+        """
+        Initialize task detector with Gemini 3 Flash.
         
-        # Initialize GenAI client
+        Args:
+            client: GenAI client to share (e.g. GeminiPolicy.client); created here if None
+        """
         from google.genai import types as genai_types
-        self.client = genai.Client(
-            api_key=api_key,
-            http_options=genai_types.HttpOptions(timeout=120000)  # 120 seconds = 120000 milliseconds
-        )
+        if client is None:
+            # Get API key
+            api_key = os.environ.get("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY environment variable not set")
+            
+            # Initialize GenAI client (same keep-alive pool / HTTP/2 settings as the planner,
+            # so consecutive checks reuse one TLS connection)
+            client = genai.Client(
+                api_key=api_key,
+                http_options=genai_types.HttpOptions(
+                    timeout=120000,  # 120 seconds = 120000 milliseconds
+                    client_args=http_client_args()
+                )
+            )
+        self.client = client
         
         # Model: Gemini 3 Flash Preview (fast and cheap for detection)
         self.model_name = "gemini-3-flash-preview"
-    
-    def _image_to_bytes(self, image: np.ndarray) -> bytes:
-        """Convert numpy image to JPEG bytes."""
-        # Convert BGR to RGB
-        if len(image.shape) == 3 and image.shape[2] == 3:
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        else:
-            image_rgb = image
         
-        # Convert to PIL Image
-        pil_image = Image.fromarray(image_rgb)
+        # Frames encoded here (no image_bytes given) are downscaled to this long edge,
+        # like the planner's current image
+        self.max_image_dim = 768
+        self._imencode_params = [cv2.IMWRITE_JPEG_QUALITY, 80]
         
-        # Convert to JPEG bytes
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format="JPEG", quality=85)
-        return buffer.getvalue()
+        # Request config is the same for every check
+        self.config = genai_types.GenerateContentConfig(
+            temperature=0.1,  # Low temperature for consistent detection
+            responseMimeType="application/json",  # Request JSON response
+            httpOptions=genai_types.HttpOptions(timeout=120000)  # 120 seconds = 120000 milliseconds
+        )
+    
+    def warmup(self) -> bool:
+        """
+        Open the connection before the first check (model metadata lookup, no generation).
+        
+        Returns:
+            True if the request succeeded
+        """
+        try:
+            self.client.models.get(model=self.model_name)
+            return True
+        except Exception as e:
+            print(f"Warning: Task detector warmup failed: {e}")
+            return False
+    
+    def _image_to_bytes(self, image: np.ndarray) -> bytes:
+        """Convert a BGR numpy image to JPEG bytes (long edge at most max_image_dim)."""
+        height, width = image.shape[:2]
+        scale = self.max_image_dim / max(height, width)
+        if scale < 1.0:
+            image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        # OpenCV encodes BGR directly (no RGB conversion / PIL round trip)
+        ok, buffer = cv2.imencode(".jpg", image, self._imencode_params)
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        return buffer.tobytes()
     
     def check_completion(self, 
                         image: np.ndarray,
                         task_description: str,
-                        last_action: Optional[str] = None) -> Dict[str, Any]:
+                        last_action: Optional[str] = None,
+                        image_bytes: Optional[bytes] = None) -> Dict[str, Any]:
         """
         Check if the current task has been completed.
         
@@ -64,6 +134,7 @@ class TaskDetector:
             image: Current camera frame
             task_description: The task to check (e.g., "pick up red block")
             last_action: Last action taken (optional, for context)
+            image_bytes: The frame already JPEG-encoded (optional, skips encoding here)
         
         Returns:
             {
@@ -76,31 +147,13 @@ class TaskDetector:
         try:
             from google.genai import types
             
-            # Build prompt for task completion check
-            prompt = f"""You are a task completion checker for a robot.
-
-Current task: {task_description}
-
-Last action: {last_action if last_action else "None"}
-
-Look at the image and determine if the task has been completed. 
-
-Return your answer in this exact JSON format:
-{{
-    "completed": true or false,
-    "confidence": 0.0 to 1.0,
-    "reason": "brief explanation",
-    "evidence": "what you see in the image that supports your conclusion"
-}}
-
-Be strict - the task is only completed if it is clearly and fully done. If uncertain, return completed=false."""
-            
-            # Prepare contents
-            parts = [types.Part.from_text(text=prompt)]
+            # Prepare contents (prompt for task completion check)
+            parts = [_completion_prompt_part(task_description, last_action)]
             
             # Add image
             try:
-                image_bytes = self._image_to_bytes(image)
+                if image_bytes is None:
+                    image_bytes = self._image_to_bytes(image)
                 parts.append(types.Part.from_bytes(
                     data=image_bytes,
                     mime_type="image/jpeg"
@@ -115,18 +168,11 @@ Be strict - the task is only completed if it is clearly and fully done. If uncer
             
             contents = [types.Content(parts=parts)]
             
-            # Build config
-            config = types.GenerateContentConfig(
-                temperature=0.1,  # Low temperature for consistent detection
-                responseMimeType="application/json",  # Request JSON response
-                httpOptions=genai_types.HttpOptions(timeout=120000)  # 120 seconds = 120000 milliseconds
-            )
-            
             # Call API
             response = self.client.models.generate_content(
                 model=self.model_name,
                 contents=contents,
-                config=config
+                config=self.config
             )
             
             # Parse response
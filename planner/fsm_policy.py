@@ -10,6 +10,9 @@ from typing import Dict, Any, Optional, Tuple
 import yaml
 import os
 
+# libyaml-backed loader when PyYAML was built with it
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 class Phase(Enum):
     """Task execution phases."""
@@ -37,7 +40,7 @@ class FSMPolicy:
         """
         # Load thresholds
         with open(thresholds_path, 'r') as f:
-            self.thresholds = yaml.safe_load(f)['thresholds']
+            self.thresholds = yaml.load(f, Loader=_YamlLoader)['thresholds']
         
         # State variables
         self.phase = Phase.SEARCH
@@ -7,35 +7,355 @@ Task completion detection uses gemini-3-flash-preview (separate detector).
 
 import os
 import json
+import asyncio
+import hashlib
 import logging
+import threading
+import concurrent.futures
+import queue
+import time
+import re
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from google import genai
-from PIL import Image
-import io
+from google.genai import types as genai_types
 import numpy as np
 import cv2
+import yaml
 from dotenv import load_dotenv
 
-from planner.prompts import get_system_prompt, format_state_summary, get_tool_descriptions
+try:
+    import simplejpeg  # Optional: libjpeg-turbo binding, faster than cv2.imencode
+except ImportError:
+    simplejpeg = None
+
+try:
+    import orjson  # Optional: much faster JSON serialization for prompt logs
+except ImportError:
+    orjson = None
+
+from genai_http import http_client_args
+from planner.prompts import (get_system_prompt, get_task_message, format_state_summary,
+                             format_state_delta, format_history, get_tool_descriptions,
+                             get_tool_descriptions_json_bytes)
+
+# Resolved once; used on every plan() call
+_Part_from_bytes = genai_types.Part.from_bytes
+_Part_from_text = genai_types.Part.from_text
+_FunctionDeclaration = genai_types.FunctionDeclaration
+
+# libyaml-backed loader when PyYAML was built with it
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 # Set up logger for Gemini API calls
 gemini_logger = logging.getLogger("gemini_api")
 gemini_logger.setLevel(logging.DEBUG)
+# Per-plan console notes: a child of the executor's console trace (--quiet / --verbose)
+planner_trace = logging.getLogger("executor.planner")
 
 # Load environment variables from .env file
 load_dotenv()
 
 
+def _json_default(obj: Any) -> Any:
+    """JSON fallback for log records: mappings (e.g. LazyArgsDict) as dicts, anything else as str."""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    return str(obj)
+
+
+def _dumps_log(obj: Any) -> bytes:
+    """Serialize a log record as indented UTF-8 JSON (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            default=_json_default
+        )
+    return json.dumps(obj, indent=2, ensure_ascii=False, default=_json_default).encode('utf-8')
+
+
+class LazyArgsDict(Mapping):
+    """
+    Read-only view of non-dict function call args (e.g. a protobuf Struct).
+    
+    Values are converted only when a key is accessed; dict(view) materializes
+    everything (done by the log writer, off the planning path).
+    """
+    
+    __slots__ = ("_args", "_cache")
+    
+    def __init__(self, args):
+        self._args = args
+        self._cache = {}
+    
+    def __getitem__(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = self._args[key]
+            return value
+    
+    def __iter__(self):
+        return iter(self._args.keys())
+    
+    def __len__(self):
+        return len(self._args)
+    
+    def __repr__(self):
+        return f"LazyArgsDict({dict(self)!r})"
+
+
+# "Function call: name(k=v, ...)" lines stored in model history messages
+_FUNCTION_CALL_LINE_RE = re.compile(r"Function call: (\w+)\((.*)\)")
+
+
+def _action_category(name: str, params_str: str) -> str:
+    """Coarse category of a past action for the evicted-history summary."""
+    if name != "base_step":
+        return {
+            "arm_move_xyz": "arm moves",
+            "arm_to_safe_pose": "safe-pose resets",
+            "gripper_open": "gripper opens",
+            "gripper_close": "gripper closes",
+        }.get(name, name)
+    params = {}
+    for item in params_str.split(", "):
+        key, _, value = item.partition("=")
+        try:
+            params[key] = float(value)
+        except ValueError:
+            pass
+    if params.get("velocity", 0.0) <= 0.0:
+        return "rotations" if params.get("angular_rate", 0.0) else "base stops"
+    direction = params.get("direction", 0.0) % 360
+    # 0=forward, 90=right, 180=backward, 270=left (see base_step tool description)
+    for center, label in ((0, "forward moves"), (90, "strafes right"), (180, "backward moves"),
+                          (270, "strafes left"), (360, "forward moves")):
+        if abs(direction - center) <= 45:
+            return label
+    return "base moves"
+
+
+def _image_signature(image: Optional[np.ndarray]) -> Optional[int]:
+    """
+    Coarse signature of a frame for the plan caches: hash of a 16x12 grayscale
+    downscale quantized to 8 levels. Equal for repeated views of a static scene,
+    different once the view moves; None when there is no image.
+    """
+    if image is None:
+        return None
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (16, 12), interpolation=cv2.INTER_AREA) >> 5
+    return hash(small.tobytes())
+
+
+# Recently encoded frames: (data ptr, shape, row stride, compress, settings) -> (ndarray, jpeg bytes)
+# (shared by the executor thread and the policy event-loop threads, hence the lock)
+_ENC_CACHE: OrderedDict = OrderedDict()
+_ENC_CACHE_MAX = 4
+_ENC_CACHE_LOCK = threading.Lock()
+
+
+class GeminiBatchDispatcher:
+    """
+    Coalesces plan requests from several GeminiPolicy instances into one Gemini call.
+    
+    Requests for the same model, system prompt and tool set that arrive within
+    window_s are sent as a single request (with the system prompt and tools inline,
+    since each policy's context cache is its own): one user turn with a section per robot (its full
+    conversation - task turn, history and current state/image - flattened to text
+    and images), and the model is asked for one function call per robot
+    in order. The ordered function calls are split back into one response per
+    robot. A lone request, a non-tool (structured output) request, or a batched
+    answer with the wrong number of calls falls back to individual requests.
+    
+    Usage:
+        dispatcher = GeminiBatchDispatcher()
+        for policy in policies:
+            policy.batch_dispatcher = dispatcher
+    """
+    
+    def __init__(self, window_s: float = 0.05, client: Optional[Any] = None):
+        """
+        Args:
+            window_s: How long to wait for other robots' requests after the first one
+            client: GenAI client used only by the dispatcher (default: new client
+                    from GEMINI_API_KEY; not shared with a policy, since the async
+                    client is bound to the event loop it is first used on)
+        """
+        if client is None:
+            api_key = os.environ.get("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY environment variable not set")
+            client = genai.Client(
+                api_key=api_key,
+                http_options=genai_types.HttpOptions(
+                    timeout=120000,  # 120 seconds = 120000 milliseconds
+                    client_args=http_client_args(),
+                    async_client_args=http_client_args()
+                )
+            )
+        self.client = client
+        self.window_s = window_s
+        self._pending = []  # (model, contents, config, inline_config, asyncio.Future)
+        self._flush_handle = None
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self._loop.run_forever, name="gemini-batch-loop", daemon=True
+        )
+        self._loop_thread.start()
+    
+    def submit(self, model: str, contents: list, config, inline_config=None) -> "concurrent.futures.Future":
+        """
+        Queue one request; thread-safe. Returns a future with the GenerateContentResponse.
+        
+        Args:
+            config: Config for sending this request alone (may use the policy's context cache)
+            inline_config: Same config with systemInstruction and tools inline, used for a
+                           batched call (context caches are per policy; default: config)
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._submit(model, contents, config, inline_config or config), self._loop
+        )
+    
+    async def _submit(self, model, contents, config, inline_config):
+        future = self._loop.create_future()
+        self._pending.append((model, contents, config, inline_config, future))
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.window_s, self._flush)
+        return await future
+    
+    def _flush(self):
+        """Group the pending requests and send them (runs on the dispatcher loop)."""
+        pending, self._pending = self._pending, []
+        self._flush_handle = None
+        groups: Dict[Any, list] = {}
+        for request in pending:
+            model, _, _, inline_config, _ = request
+            batchable = bool(inline_config.tools) and not inline_config.response_mime_type
+            if batchable:
+                tool_names = tuple(declaration.name for tool in inline_config.tools
+                                   for declaration in tool.function_declarations or ())
+                key = (model, inline_config.system_instruction, tool_names)
+            else:
+                key = id(request)
+            groups.setdefault(key, []).append(request)
+        for requests_in_group in groups.values():
+            asyncio.ensure_future(self._send_group(requests_in_group))
+    
+    async def _send_single(self, request):
+        model, contents, config, _, future = request
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=model, contents=contents, config=config
+            )
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(response)
+    
+    @staticmethod
+    def _flatten_contents(contents: list) -> list:
+        """
+        One robot's conversation as parts of a single user turn.
+        
+        Text and images are kept; each turn is introduced by its role, and function
+        calls/responses (only valid in their own turns) are rendered as text.
+        """
+        parts = []
+        for content in contents:
+            parts.append(_Part_from_text(text=f"[{content.role or 'user'}]"))
+            for part in content.parts or ():
+                if part.function_call is not None:
+                    call = part.function_call
+                    parts.append(_Part_from_text(text=f"Called {call.name}({dict(call.args or {})})"))
+                elif part.function_response is not None:
+                    result = part.function_response
+                    parts.append(_Part_from_text(text=f"Result of {result.name}: {result.response}"))
+                elif part.text or part.inline_data is not None:
+                    parts.append(part)
+        return parts
+    
+    async def _send_group(self, group: list):
+        if len(group) == 1:
+            await self._send_single(group[0])
+            return
+        
+        model, _, _, config, _ = group[0]
+        parts = [_Part_from_text(text=(
+            f"You are controlling {len(group)} robots. "
+            f"Each robot's task and current observation follow under its own header. "
+            f"Call exactly one function per robot, in robot order (Robot 1 first), "
+            f"and no other functions."
+        ))]
+        for index, (_, contents, _, _, _) in enumerate(group, start=1):
+            parts.append(_Part_from_text(text=f"=== Robot {index} ==="))
+            parts.extend(self._flatten_contents(contents))
+        
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=model, contents=[genai_types.Content(role="user", parts=parts)], config=config
+            )
+            function_calls = response.function_calls or []
+        except Exception as e:
+            gemini_logger.warning(f"Batched Gemini request failed ({e}), sending individually")
+            function_calls = None
+        
+        if function_calls is None or len(function_calls) != len(group):
+            if function_calls is not None:
+                gemini_logger.warning(f"Batched response had {len(function_calls)} function calls "
+                                      f"for {len(group)} robots, sending individually")
+            await asyncio.gather(*(self._send_single(request) for request in group))
+            return
+        
+        # Only each robot's own call: the batch's text mixes all robots' reasoning
+        for (_, _, _, _, future), function_call in zip(group, function_calls):
+            if future.done():
+                continue
+            future.set_result(genai_types.GenerateContentResponse(candidates=[genai_types.Candidate(
+                content=genai_types.Content(role="model", parts=[genai_types.Part(function_call=function_call)])
+            )]))
+
+
 class GeminiPolicy:
     """Gemini Robotics-ER 1.5 policy for robot control with high-level planning."""
     
-    def __init__(self, thresholds_path: str = "config/thresholds.yaml"):
+    # Heuristic plans used when the API call fails, keyed by (found, found and area_ratio < 0.05).
+    # Copied and filled with phase/why (formatted with area_ratio) on use.
+    _FALLBACK_APPROACH = {
+        "action": "base_step",
+        "params": {"velocity": 50.0, "direction": 0.0, "angular_rate": 0.0, "duration": 0.3},
+        "why": "API timeout fallback: approaching target (area={area_ratio:.4f})"
+    }
+    _FALLBACK_ARM = {
+        "action": "arm_to_safe_pose",
+        "params": {},
+        "why": "API timeout fallback: target close (area={area_ratio:.4f}), moving arm"
+    }
+    _FALLBACK_SEARCH = {
+        "action": "base_step",
+        "params": {"velocity": 0.0, "direction": 0.0, "angular_rate": 15.0, "duration": 0.3},  # Rotate
+        "why": "API timeout fallback: target not found, searching"
+    }
+    _FALLBACK_TABLE = {
+        (True, True): _FALLBACK_APPROACH,   # Target far, approach
+        (True, False): _FALLBACK_ARM,       # Target close, use arm
+        (False, False): _FALLBACK_SEARCH,   # Target not found, search
+    }
+    
+    def __init__(self, thresholds_path: str = "config/thresholds.yaml",
+                 thresholds: Optional[Dict[str, Any]] = None):
         """
         Initialize Gemini policy.
         
         Args:
             thresholds_path: Path to thresholds configuration
+            thresholds: The already-parsed "thresholds" section (skips reading thresholds_path)
         """
         # Get API key
         api_key = os.environ.get("GEMINI_API_KEY")
@@ -43,10 +363,13 @@ class GeminiPolicy:
             raise ValueError("GEMINI_API_KEY environment variable not set")
         
         # Initialize GenAI client with increased timeout
-        from google.genai import types as genai_types
         self.client = genai.Client(
             api_key=api_key,
-            http_options=genai_types.HttpOptions(timeout=120000)  # 120 seconds = 120000 milliseconds
+            http_options=genai_types.HttpOptions(
+                timeout=120000,  # 120 seconds = 120000 milliseconds
+                client_args=http_client_args(),
+                async_client_args=http_client_args()
+            )
         )
         
         # Model name: Gemini Robotics-ER 1.5 Preview
@@ -57,23 +380,138 @@ class GeminiPolicy:
         # self.model_name = "gemini-3-flash-preview"
         # self.model_name = "gemini-3-pro-preview"
         
-        # System prompt (will be updated with task description in plan method)
+        # Optional secondary model raced against the primary when it is slow
+        # (e.g. "gemini-3-flash-preview"). None disables hedging.
+        self.fallback_model_name = None
+        # Seconds to wait for the primary model before starting the fallback model
+        self.hedge_after_s = 5.0
+        # Hard limit for one planning request (same as the HTTP timeout)
+        self.request_timeout_s = 120.0
+        
+        # Constrained JSON output instead of function calling (opt-in).
+        # The model must return {"thinking", "action", "params"} for one of the tools,
+        # so free-text function calls (and the text-parsing fallback) become rare.
+        self.structured_output = False
+        
+        # Speculative prefetch (opt-in): while an action executes, plan the next step
+        # from a predicted post-action state. predict_next_state(image, detection,
+        # state_summary, action_plan) must return (detection, state_summary,
+        # last_action_result) or None; the prefetched plan is used only if the real
+        # next state has the same fingerprint (without the frame signature: the
+        # prefetch is planned from the pre-action frame), otherwise it is discarded.
+        # Deliberately unwired: nothing in this tree sets a predictor, since a useful
+        # one needs a motion model of the detection; callers plug in their own.
+        self.speculative_prefetch = False
+        self.predict_next_state = None
+        
+        # Action chunks (opt-in): Gemini may return up to this many function calls per
+        # response. The first is the plan; the rest go to action_plan["action_chunk"]
+        # and the executor runs them without new planning requests. 1 = one action.
+        self.max_action_chunk = 1
+        self._pending_plan: Optional[asyncio.Task] = None
+        self._pending_fingerprint: Optional[int] = None
+        self._pending_messages: Optional[list] = None  # History snapshot to restore on discard
+        self._pending_evicted_counts: Optional[Counter] = None
+        self._pending_delta_state: Optional[Tuple[Optional[str], int]] = None  # (_last_state_text, _turns_since_full_state)
+        
+        # Keep the pooled connection warm: when no request was made for this many
+        # seconds, send a cheap models.get. None disables the ping.
+        self.keepalive_interval_s = 60.0
+        self._last_request_time = 0.0
+        self._keepalive_task: Optional[asyncio.Task] = None
+        
+        # Stream responses and return as soon as the function call arrives; the rest
+        # of the stream (trailing text) is read and logged in the background
+        self.stream_responses = True
+        self._background_tasks = set()
+        
+        # Optional GeminiBatchDispatcher shared by several policies (multi-robot).
+        # When set, requests go through it instead of this policy's client (no hedging).
+        self.batch_dispatcher: Optional[GeminiBatchDispatcher] = None
+        
+        # Dedicated event loop for async Gemini calls, so plan() stays synchronous for the executor
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self._loop.run_forever, name="gemini-policy-loop", daemon=True
+        )
+        self._loop_thread.start()
+        
+        # System prompt is static (cacheable); the task is sent as the first user turn
         self.base_system_prompt = get_system_prompt()
         self.system_prompt = self.base_system_prompt
         self.current_task = None
+        self._task_content: Optional[genai_types.Content] = None  # get_task_message() turn for current_task
+        
+        # Tool schema is static: build FunctionDeclarations, Tool and the log view once
+        self.completion_tool_enabled = False
+        self._set_tools(include_task_complete=False)
+        # Server-side context cache for system prompt + tools, keyed by prompt content
+        # (the prompt is static, so one cache serves every task). Falls back to the
+        # inline system prompt if the model/prompt cannot be cached.
+        self.context_cache_enabled = True
+        self.context_cache_ttl_s = 3600.0
+        self.context_cache_max_entries = 4  # Least recently used caches beyond this are deleted
+        self._context_caches: OrderedDict = OrderedDict()  # (system prompt, tools JSON) -> [cache name, refresh_at]
+        self._cached_content_name: Optional[str] = None  # Cache for the current system prompt
+        self._context_cache_failed_key: Optional[Tuple[str, bytes]] = None
+        self._context_cache_lock: Optional[asyncio.Lock] = None  # Created on self._loop
+        
+        # GenerateContentConfig cache, keyed by (system prompt, structured_output, context cache)
+        self._configs: Dict[tuple, Any] = {}  # (system prompt, structured, context cache) -> config
         
         # Conversation history
         self.messages = []
         
+        # Delta state encoding (opt-in): after a full state, the next turns only
+        # carry what changed. A full state is re-sent every full_state_every turns,
+        # which must stay within the history window so one is always in context.
+        self.delta_state = False
+        self.full_state_every = 4
+        self._last_state_text: Optional[str] = None
+        self._turns_since_full_state = 0
+        
         # Maximum number of messages to keep in history (to prevent token quota exhaustion)
         # Each message pair (user + model) = 1 interaction
         # 10 messages = 5 interactions
         self.max_history_messages = 10
         
+        # Current image settings: long edge capped at max_image_dim before encoding.
+        # Gemini downsamples to its own patch grid anyway, and the model reports
+        # points in normalized coordinates, so a smaller upload loses no accuracy.
+        self.max_image_dim = 768
+        self.image_jpeg_quality = 80
+        
+        # Adaptive current-image compression (opt-in): low-texture scenes (blank floor
+        # while searching) are sent smaller and at lower quality; see _ADAPTIVE_IMAGE_TIERS.
+        # Never exceeds max_image_dim / image_jpeg_quality.
+        self.adaptive_image_quality = False
+        
+        # Channel order of incoming frames (camera frames are BGR); see set_color_format()
+        self._input_is_bgr: bool = True
+        
         # Image compression settings for history (to reduce token usage)
-        # Current images use full resolution, history images are compressed
+        # Current images are sent near full resolution, history images are compressed
         self.history_image_max_size = (320, 240)  # (width, height) for history images
         self.history_image_quality = 70  # JPEG quality (0-100) for history images
+        self._apply_image_thresholds(thresholds_path, thresholds)
+        
+        # Resize destination buffers, reused across frames (thread-local: plan_batch
+        # may encode on the caller's thread while the policy loop encodes too)
+        self._resize_buffers = threading.local()
+        
+        # Per-category counts of actions evicted from the history window (summarized in the prompt)
+        self._evicted_action_counts: Counter = Counter()
+        
+        # Content-addressed store for history JPEG bytes: blake2b digest -> [bytes, refcount]
+        # Identical history frames share one bytes object across self.messages
+        self._image_bytes_cache: Dict[bytes, list] = {}
+        
+        # Template cache: state fingerprint -> (iteration, action_plan) from recent
+        # Gemini responses. On a fresh hit the API call is skipped (opt-in).
+        self.template_cache_enabled = False
+        self.template_cache_size = 64
+        self.template_cache_ttl_iterations = 20  # Entries older than this are evicted
+        self._template_cache: OrderedDict = OrderedDict()
         
         # Image size (for compatibility with executor)
         self.image_center = None
@@ -85,43 +523,661 @@ class GeminiPolicy:
         # Log directory for detailed prompts
         self.log_dir = Path("logs")
         self.current_log_dir = None
+        # Prompt/response logs are written by one background thread (keeps write order).
+        # Bounded queue: if the disk falls behind, the oldest pending writes are dropped.
+        self._log_queue: queue.Queue = queue.Queue(maxsize=256)
+        self._log_dropped = 0
+        self._log_thread = threading.Thread(target=self._log_writer_loop, name="gemini-log-writer", daemon=True)
+        self._log_thread.start()
+        self._logged_system_prompts = set()  # Hashes already written to the current log dir
+        self._logged_tools = False  # tools.json written to the current log dir
+    
+    # Laplacian-variance thresholds -> (JPEG quality, long edge) for adaptive compression.
+    # Scenes above the last threshold use image_jpeg_quality / max_image_dim.
+    _ADAPTIVE_IMAGE_TIERS = ((50.0, 55, 512), (200.0, 70, 640))
+    
+    def _apply_image_thresholds(self, thresholds_path: str, thresholds: Optional[Dict[str, Any]] = None):
+        """
+        Override the image settings from the optional "image" section of the thresholds file.
+        
+        Args:
+            thresholds_path: Path to thresholds configuration
+            thresholds: The already-parsed "thresholds" section (thresholds_path is not read)
+        """
+        if thresholds is None:
+            try:
+                with open(thresholds_path, 'r') as f:
+                    thresholds = (yaml.load(f, Loader=_YamlLoader) or {}).get('thresholds', {})
+            except OSError as e:
+                print(f"Warning: Could not read image settings from {thresholds_path}: {e}")
+                return
+        image_config = thresholds.get('image') or {}
+        self.max_image_dim = int(image_config.get('max_dim', self.max_image_dim))
+        self.image_jpeg_quality = int(image_config.get('jpeg_quality', self.image_jpeg_quality))
+        self.adaptive_image_quality = bool(image_config.get('adaptive_quality', self.adaptive_image_quality))
+        if 'history_max_size' in image_config:
+            self.history_image_max_size = tuple(int(v) for v in image_config['history_max_size'])
+        self.history_image_quality = int(image_config.get('history_jpeg_quality', self.history_image_quality))
     
     def set_image_size(self, width: int, height: int):
         """Set image dimensions (for compatibility with executor)."""
         self.image_center = (width // 2, height // 2)
     
+    def set_color_format(self, color_format: str):
+        """
+        Declare the channel order of incoming frames.
+        
+        Args:
+            color_format: "BGR" (OpenCV camera frames, default) or "RGB" (e.g. simulator/ROS)
+        """
+        color_format = color_format.upper()
+        if color_format not in ("BGR", "RGB"):
+            raise ValueError(f"Unsupported color format: {color_format}")
+        self._input_is_bgr = color_format == "BGR"
+    
+    def _set_tools(self, include_task_complete: bool):
+        """Build the FunctionDeclarations, Tool and logged schema for the tool set."""
+        self._tool_descs = get_tool_descriptions(include_task_complete)
+        self._function_declarations = [
+            _FunctionDeclaration(
+                name=tool_desc["name"],
+                description=tool_desc["description"],
+                parametersJsonSchema=tool_desc["parameters"]
+            )
+            for tool_desc in self._tool_descs
+        ]
+        self._tools = [genai_types.Tool(functionDeclarations=self._function_declarations)]
+        # Tool list as logged: the module's pre-serialized schema, written once per log dir (see _tools_ref)
+        self._tools_log_bytes = get_tool_descriptions_json_bytes(include_task_complete)
+    
+    def enable_completion_tool(self):
+        """
+        Offer the task_complete tool, so the planner reports completion in its own response.
+        
+        Its plan then carries "completion" ({completed, confidence, reason, evidence}, the
+        TaskDetector result format) and the separate completion-check request can be
+        skipped. Call before warmup()/the first plan(): the tools are part of the
+        context cache.
+        """
+        if self.completion_tool_enabled:
+            return
+        self.completion_tool_enabled = True
+        self._set_tools(include_task_complete=True)
+        self._configs.clear()
+        self._logged_tools = False
+    
+    def encode_image(self, image: np.ndarray) -> bytes:
+        """
+        JPEG bytes of a frame exactly as plan() sends it (cached per frame object).
+        
+        Lets the caller reuse the encoding (e.g. for the completion check and the
+        iteration log); plan() with the same ndarray then hits the cache.
+        """
+        return self._image_to_bytes(image, compress=False)
+    
     def _image_to_bytes(self, image: np.ndarray, compress: bool = False) -> bytes:
         """
         Convert numpy image to bytes.
         
+        Re-encoding the same frame (same ndarray object, e.g. a paused/cached frame
+        passed to plan() and then to history) is served from a small module-level cache.
+        Frames must not be modified in place after being passed in.
+        
         Args:
             image: Input image as numpy array
             compress: If True, compress image for history (lower resolution and quality)
                      If False, use full resolution for current observation
         """
-        # Convert BGR to RGB if needed
-        if len(image.shape) == 3 and image.shape[2] == 3:
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        else:
-            image_rgb = image
+        key = (image.ctypes.data, image.shape, image.strides[0], compress, self._input_is_bgr,
+               self.history_image_max_size if compress else self.max_image_dim,
+               self.history_image_quality if compress else self.image_jpeg_quality,
+               self.adaptive_image_quality and not compress)
+        with _ENC_CACHE_LOCK:
+            entry = _ENC_CACHE.get(key)
+            # The cached entry holds a reference to its array, so the data pointer
+            # cannot have been reused by another buffer while the entry exists
+            if entry is not None and entry[0] is image:
+                _ENC_CACHE.move_to_end(key)
+                return entry[1]
         
-        # Convert to PIL Image
-        pil_image = Image.fromarray(image_rgb)
+        # Encode outside the lock; a concurrent miss on the same frame just encodes twice
+        image_bytes = self._encode_jpeg(image, compress)
+        with _ENC_CACHE_LOCK:
+            _ENC_CACHE[key] = (image, image_bytes)
+            while len(_ENC_CACHE) > _ENC_CACHE_MAX:
+                _ENC_CACHE.popitem(last=False)
+        return image_bytes
+    
+    def _encode_jpeg(self, image: np.ndarray, compress: bool) -> bytes:
+        """
+        Encode numpy image to JPEG bytes (uncached, see _image_to_bytes).
         
-        # Compress if requested (for history)
+        Frames are encoded in their own channel order (see set_color_format):
+        JPEG stores YCbCr and simplejpeg takes BGR or RGB directly, so no channel
+        swap is done. Only cv2.imencode with RGB input needs one (it expects BGR).
+        simplejpeg is used when installed.
+        """
         if compress:
-            # Resize to reduce token usage
-            pil_image.thumbnail(self.history_image_max_size, Image.Resampling.LANCZOS)
+            # Resize to reduce token usage (fit within history_image_max_size, never upscale)
+            max_w, max_h = self.history_image_max_size
+            height, width = image.shape[:2]
+            scale = min(max_w / width, max_h / height)
+            if scale < 1.0:
+                new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+                image = self._resize(image, new_size)
+            # Use lower quality for history images
+            quality = self.history_image_quality
+        else:
+            # Current image: cap the long edge (never upscale)
+            quality, max_dim = self.image_jpeg_quality, self.max_image_dim
+            if self.adaptive_image_quality:
+                quality, max_dim = self._adaptive_image_settings(image)
+            height, width = image.shape[:2]
+            scale = max_dim / max(height, width)
+            if scale < 1.0:
+                new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+                image = self._resize(image, new_size)
+        
+        if simplejpeg is not None and image.ndim == 3 and image.shape[2] == 3 and image.dtype == np.uint8:
+            # fastdct: faster DCT variant, no visible difference at these qualities
+            if not image.flags.c_contiguous:
+                image = np.ascontiguousarray(image)
+            return simplejpeg.encode_jpeg(image, quality=quality,
+                                          colorspace='BGR' if self._input_is_bgr else 'RGB', fastdct=True)
+        
+        if not self._input_is_bgr and image.ndim == 3 and image.shape[2] == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
         
-        # Convert to bytes
-        buffer = io.BytesIO()
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
         if compress:
-            # Use lower quality for history images
-            pil_image.save(buffer, format="JPEG", quality=self.history_image_quality, optimize=True)
+            params += [int(cv2.IMWRITE_JPEG_OPTIMIZE), 1]
+        ok, buffer = cv2.imencode('.jpg', image, params)
+        if not ok:
+            raise ValueError(f"JPEG encoding failed for image of shape {image.shape}")
+        return buffer.tobytes()
+    
+    def _adaptive_image_settings(self, image: np.ndarray) -> Tuple[int, int]:
+        """
+        Pick JPEG quality and long edge for the current image from its texture.
+        
+        Texture is the variance of the Laplacian over a ~256px grayscale thumbnail
+        (well under 1ms). Low-texture frames compress to fewer bytes at lower
+        quality without losing anything the model could use.
+        
+        Returns:
+            (quality, max_dim)
+        """
+        if image.ndim == 3 and image.shape[2] >= 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY if self._input_is_bgr else cv2.COLOR_RGB2GRAY)
         else:
-            # Full quality for current images
-            pil_image.save(buffer, format="JPEG", quality=95)
-        return buffer.getvalue()
+            gray = image
+        height, width = gray.shape[:2]
+        scale = 256 / max(height, width)
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                              interpolation=cv2.INTER_AREA)
+        lap_var = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+        for threshold, quality, max_dim in self._ADAPTIVE_IMAGE_TIERS:
+            if lap_var < threshold:
+                return min(quality, self.image_jpeg_quality), min(max_dim, self.max_image_dim)
+        return self.image_jpeg_quality, self.max_image_dim
+    
+    def _resize(self, image: np.ndarray, new_size: Tuple[int, int]) -> np.ndarray:
+        """
+        INTER_AREA resize into a reused per-thread destination buffer.
+        
+        The result is only valid until the next resize to the same size on this
+        thread; it is consumed by the encoder right away.
+        """
+        buffers = getattr(self._resize_buffers, "by_shape", None)
+        if buffers is None:
+            buffers = self._resize_buffers.by_shape = {}
+        shape = (new_size[1], new_size[0]) + image.shape[2:]
+        key = (shape, image.dtype.str)
+        dst = buffers.get(key)
+        if dst is None:
+            dst = buffers[key] = np.empty(shape, dtype=image.dtype)
+        return cv2.resize(image, new_size, dst=dst, interpolation=cv2.INTER_AREA)
+    
+    def _lookup_template(self, fingerprint: int, iteration: int) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the cached plan for this state, or None.
+        
+        Entries older than template_cache_ttl_iterations are evicted on lookup.
+        """
+        entry = self._template_cache.get(fingerprint)
+        if entry is None:
+            return None
+        stored_iteration, action_plan = entry
+        if iteration - stored_iteration > self.template_cache_ttl_iterations:
+            del self._template_cache[fingerprint]
+            return None
+        self._template_cache.move_to_end(fingerprint)
+        return {
+            "action": action_plan["action"],
+            "params": dict(action_plan["params"]),
+            "phase": action_plan["phase"],
+            "why": "template-cache hit",
+            "thinking_process": None
+        }
+    
+    def _store_template(self, fingerprint: int, action_plan: Dict[str, Any], iteration: int):
+        """
+        Remember a Gemini action plan for this state (LRU, bounded size).
+        
+        Only action, params and phase are kept. Completion declarations and action
+        chunks are never cached: replaying them would end the run or queue stale moves.
+        """
+        if action_plan["action"] == "task_complete" or action_plan.get("action_chunk"):
+            return
+        action_plan = {
+            "action": action_plan["action"],
+            "params": dict(action_plan.get("params") or {}),
+            "phase": action_plan.get("phase", "unknown")
+        }
+        self._template_cache[fingerprint] = (iteration, action_plan)
+        self._template_cache.move_to_end(fingerprint)
+        while len(self._template_cache) > self.template_cache_size:
+            self._template_cache.popitem(last=False)
+    
+    @staticmethod
+    def _extract_response(response) -> Tuple[str, Any]:
+        """
+        Pull the thinking text and the function call out of a Gemini response.
+        
+        The SDK response types always define these attributes (possibly None),
+        so they are read directly instead of probed with hasattr.
+        
+        Returns:
+            (response_text, function_call) - all text parts of the first candidate
+            joined by newlines, and the last function call part (or None)
+        """
+        texts = []
+        function_call = None
+        candidates = response.candidates
+        if candidates:
+            content = candidates[0].content
+            for part in (content.parts or ()) if content else ():
+                if part.text:
+                    texts.append(part.text)
+                # Keep only the last one if multiple
+                if part.function_call:
+                    function_call = part.function_call
+        response_text = "\n".join(texts)
+        
+        # Fallbacks: response-level helpers
+        if function_call is None:
+            function_calls = response.function_calls
+            if function_calls:
+                function_call = function_calls[0]
+        if not response_text:
+            response_text = response.text or ""
+        return response_text, function_call
+    
+    @staticmethod
+    def _extract_function_calls(response) -> List[Any]:
+        """All function call parts of the first candidate, in order."""
+        candidates = response.candidates
+        if not candidates or not candidates[0].content:
+            return []
+        return [part.function_call for part in (candidates[0].content.parts or ()) if part.function_call]
+    
+    def plan_batch(self,
+                   samples: List[Tuple[Optional[np.ndarray], Dict[str, Any], Dict[str, Any]]],
+                   poll_interval_s: float = 30.0,
+                   timeout_s: float = 24 * 3600.0) -> List[Dict[str, Any]]:
+        """
+        Plan many independent samples through the Gemini Batch API (offline use).
+        
+        For replay re-planning and evaluation, where latency does not matter but
+        cost and rate limits do. Each sample is planned on its own: no conversation
+        history is sent and self.messages is not touched.
+        
+        Args:
+            samples: List of (image, detection, state_summary) tuples, e.g. from session logs
+            poll_interval_s: Seconds between batch job status checks
+            timeout_s: Give up waiting after this many seconds
+        
+        Returns:
+            Action plans in the same order as samples (same shape as plan()); samples
+            without a usable response get the same base_stop fallback as plan()
+        """
+        
+        inlined_requests = []
+        for image, detection, state_summary in samples:
+            parts = [_Part_from_text(text=format_state_summary(state_summary))]
+            if image is not None:
+                parts.append(_Part_from_bytes(
+                    data=self._image_to_bytes(image, compress=False),
+                    mime_type="image/jpeg"
+                ))
+            task_desc = state_summary.get('task', '')
+            contents = [genai_types.Content(role="user", parts=parts)]
+            if task_desc:
+                contents.insert(0, genai_types.Content(role="user", parts=[_Part_from_text(text=get_task_message(task_desc))]))
+            inlined_requests.append(genai_types.InlinedRequest(
+                model=self.model_name,
+                contents=contents,
+                config=genai_types.GenerateContentConfig(
+                    temperature=0.3,
+                    systemInstruction=self.base_system_prompt,
+                    tools=self._tools
+                )
+            ))
+        
+        job = self.client.batches.create(
+            model=self.model_name,
+            src=inlined_requests,
+            config=genai_types.CreateBatchJobConfig(display_name=f"masterpi-plan-batch-{int(time.time())}")
+        )
+        print(f"Batch job created: {job.name} ({len(inlined_requests)} requests)")
+        
+        done_states = {
+            genai_types.JobState.JOB_STATE_SUCCEEDED,
+            genai_types.JobState.JOB_STATE_FAILED,
+            genai_types.JobState.JOB_STATE_CANCELLED,
+            genai_types.JobState.JOB_STATE_EXPIRED,
+        }
+        deadline = time.monotonic() + timeout_s
+        while job.state not in done_states:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Batch job {job.name} not finished after {timeout_s:.0f}s (state: {job.state})")
+            time.sleep(poll_interval_s)
+            job = self.client.batches.get(name=job.name)
+        
+        if job.state != genai_types.JobState.JOB_STATE_SUCCEEDED:
+            raise RuntimeError(f"Batch job {job.name} ended in state {job.state}: {job.error}")
+        
+        inlined_responses = (job.dest.inlined_responses if job.dest else None) or []
+        action_plans = []
+        for index, (_, _, state_summary) in enumerate(samples):
+            phase = state_summary.get("phase", "unknown")
+            inlined = inlined_responses[index] if index < len(inlined_responses) else None
+            if inlined is None or inlined.response is None:
+                error = inlined.error if inlined is not None else "missing response"
+                action_plans.append({
+                    "action": "base_stop",
+                    "params": {},
+                    "phase": phase,
+                    "why": f"Batch request failed: {error}",
+                    "thinking_process": None
+                })
+                continue
+            
+            response_text, function_call = self._extract_response(inlined.response)
+            if function_call:
+                action_name, params = function_call.name, self._function_call_params(function_call)
+            else:
+                action_name, params = self._parse_function_call_from_text(response_text) if response_text else (None, {})
+            if action_name:
+                action_plans.append({
+                    "action": action_name,
+                    "params": params,
+                    "phase": phase,
+                    "why": response_text or f"Gemini selected {action_name}",
+                    "thinking_process": response_text
+                })
+            else:
+                action_plans.append({
+                    "action": "base_stop",  # Safe fallback action
+                    "params": {},
+                    "phase": phase,
+                    "why": f"Gemini response: {response_text[:200] if response_text else 'No response'}",
+                    "thinking_process": response_text
+                })
+        return action_plans
+    
+    def warmup(self) -> concurrent.futures.Future:
+        """
+        Warm up before the first plan(), in the background (non-blocking).
+        
+        Creates the context cache, then sends one tiny request (1 output token)
+        so the TLS connection is open and the cached prefix has been read once
+        when the first real request goes out. Failures are only printed.
+        
+        Returns:
+            Future resolving to True if the warmup request succeeded
+        """
+        return asyncio.run_coroutine_threadsafe(self._warmup_on_loop(), self._loop)
+    
+    async def _warmup_on_loop(self) -> bool:
+        try:
+            cached_content = None
+            if self.context_cache_enabled and not self.structured_output:
+                cached_content = await self._ensure_context_cache(self.base_system_prompt)
+            if cached_content:
+                config = genai_types.GenerateContentConfig(maxOutputTokens=1, cachedContent=cached_content)
+            else:
+                config = genai_types.GenerateContentConfig(maxOutputTokens=1, systemInstruction=self.base_system_prompt)
+            await self.client.aio.models.generate_content(model=self.model_name, contents="ping", config=config)
+            self._last_request_time = time.monotonic()
+            return True
+        except Exception as e:
+            print(f"Warning: Gemini warmup request failed: {e}")
+            return False
+    
+    def prewarm_context_cache(self) -> Optional[concurrent.futures.Future]:
+        """
+        Create the context cache in the background, ahead of the first plan().
+        
+        Non-blocking: cache creation overlaps with whatever the caller does next.
+        
+        Returns:
+            Future resolving to the cache name (None if caching is off or failed)
+        """
+        if not self.context_cache_enabled or self.structured_output:
+            return None
+        return asyncio.run_coroutine_threadsafe(self._ensure_context_cache(self.base_system_prompt), self._loop)
+    
+    async def _ensure_context_cache(self, system_prompt: str) -> Optional[str]:
+        """
+        Return the name of a server-side context cache holding this system prompt and the tools.
+        
+        Created on first use for each system prompt and tool set and kept (up to
+        context_cache_max_entries) across reset(); shortly before the TTL runs
+        out it is extended in place. If creation fails (model without caching
+        support, prompt below the minimum cacheable size, ...), None is returned,
+        the prompt is sent inline as before and creation is not retried for it.
+        """
+        if self._context_cache_lock is None:
+            self._context_cache_lock = asyncio.Lock()
+        async with self._context_cache_lock:
+            return await self._ensure_context_cache_locked(system_prompt)
+    
+    async def _ensure_context_cache_locked(self, system_prompt: str) -> Optional[str]:
+        # The cache holds the tools too, so a changed tool set (enable_completion_tool) needs a new one
+        key = (system_prompt, self._tools_log_bytes)
+        now = time.monotonic()
+        # Refresh a minute early so a request never references an expired cache
+        refresh_after = max(self.context_cache_ttl_s - 60.0, 0.0)
+        entry = self._context_caches.get(key)
+        if entry is not None:
+            self._context_caches.move_to_end(key)
+            if now < entry[1]:
+                return entry[0]
+            # Extend the TTL without re-uploading the prompt; recreate if the cache is gone
+            try:
+                await self.client.aio.caches.update(
+                    name=entry[0],
+                    config=genai_types.UpdateCachedContentConfig(ttl=f"{int(self.context_cache_ttl_s)}s")
+                )
+                entry[1] = now + refresh_after
+                return entry[0]
+            except Exception as e:
+                print(f"Warning: Context cache refresh failed, recreating ({e})")
+                del self._context_caches[key]
+        if self._context_cache_failed_key == key:
+            return None
+        
+        try:
+            cached_content = await self.client.aio.caches.create(
+                model=self.model_name,
+                config=genai_types.CreateCachedContentConfig(
+                    display_name="masterpi-system-prompt",
+                    system_instruction=system_prompt,
+                    tools=self._tools if self._function_declarations else None,
+                    ttl=f"{int(self.context_cache_ttl_s)}s"
+                )
+            )
+        except Exception as e:
+            print(f"Warning: Context cache unavailable, sending system prompt inline ({e})")
+            self._context_cache_failed_key = key
+            return None
+        self._context_caches[key] = [cached_content.name, now + refresh_after]
+        print(f"  → Context cache created: {cached_content.name}")
+        while len(self._context_caches) > self.context_cache_max_entries:
+            _, (old_name, _) = self._context_caches.popitem(last=False)
+            asyncio.ensure_future(self._delete_context_cache(old_name))
+        return cached_content.name
+    
+    def _drop_context_cache(self):
+        """Forget the current prompt's context cache and delete it server-side in the background (on self._loop)."""
+        name = self._cached_content_name
+        self._cached_content_name = None
+        if not name:
+            return
+        for key, entry in list(self._context_caches.items()):
+            if entry[0] == name:
+                del self._context_caches[key]
+        asyncio.ensure_future(self._delete_context_cache(name))
+    
+    async def _delete_context_cache(self, name: str):
+        try:
+            await self.client.aio.caches.delete(name=name)
+        except Exception as e:
+            gemini_logger.debug(f"Failed to delete context cache {name}: {e}")
+    
+    def _get_config(self, inline: bool = False):
+        """
+        Return the GenerateContentConfig for the current system prompt (cached).
+        
+        inline=True never references the context cache (system prompt and tools are
+        sent in the request), as needed for another model: caches are model-bound.
+        """
+        cached_content_name = None if inline else self._cached_content_name
+        config_key = (self.system_prompt, self.structured_output, cached_content_name)
+        config = self._configs.get(config_key)
+        if config is not None:
+            return config
+        
+        if cached_content_name and not self.structured_output:
+            # System prompt and tools live in the server-side context cache
+            config = genai_types.GenerateContentConfig(
+                temperature=0.3,
+                cachedContent=cached_content_name,
+                httpOptions=genai_types.HttpOptions(timeout=120000)  # 120 seconds = 120000 milliseconds
+            )
+        elif self.structured_output:
+            # Same action space as the tools, enforced by the decoder as a JSON schema
+            config = genai_types.GenerateContentConfig(
+                temperature=0.3,
+                systemInstruction=self.system_prompt,  # System prompt in config
+                responseMimeType="application/json",
+                responseJsonSchema=self._action_response_schema(self._tool_descs),
+                httpOptions=genai_types.HttpOptions(timeout=120000)  # 120 seconds = 120000 milliseconds
+            )
+        else:
+            config = genai_types.GenerateContentConfig(
+                temperature=0.3,
+                systemInstruction=self.system_prompt,  # System prompt in config
+                tools=self._tools if self._function_declarations else None,
+                httpOptions=genai_types.HttpOptions(timeout=120000)  # 120 seconds = 120000 milliseconds
+            )
+        if len(self._configs) >= 8:
+            self._configs.clear()
+        self._configs[config_key] = config
+        return config
+    
+    @staticmethod
+    def _action_response_schema(tool_descs: list) -> Dict[str, Any]:
+        """
+        Build the JSON schema used in structured-output mode.
+        
+        One object shape per tool, so "params" is always validated against the
+        chosen action's parameter schema.
+        """
+        return {
+            "anyOf": [
+                {
+                    "type": "object",
+                    "properties": {
+                        "thinking": {
+                            "type": "string",
+                            "description": "Brief reasoning about the current observation"
+                        },
+                        "action": {
+                            "type": "string",
+                            "enum": [tool_desc["name"]],
+                            "description": tool_desc["description"]
+                        },
+                        "params": tool_desc["parameters"]
+                    },
+                    "required": ["thinking", "action", "params"]
+                }
+                for tool_desc in tool_descs
+            ]
+        }
+    
+    @staticmethod
+    def _parse_structured_response(response_text: str) -> Tuple[str, Any]:
+        """
+        Parse a structured-output response into (thinking text, FunctionCall).
+        
+        Falls back to the raw text and no function call if the JSON is not usable,
+        leaving _parse_function_call_from_text as the deep fallback.
+        """
+        try:
+            result = json.loads(response_text)
+        except (TypeError, ValueError):
+            return response_text, None
+        if not isinstance(result, dict) or not isinstance(result.get("action"), str):
+            return response_text, None
+        params = result.get("params")
+        function_call = genai_types.FunctionCall(
+            name=result["action"],
+            args=params if isinstance(params, dict) else {}
+        )
+        return result.get("thinking") or "", function_call
+    
+    @staticmethod
+    def _function_call_params(function_call) -> Dict[str, Any]:
+        """
+        Return function call args as a mapping (empty dict if none).
+        
+        The SDK already gives a plain dict, which is returned as-is; other
+        mapping-like args are wrapped in a LazyArgsDict instead of copied.
+        """
+        args = function_call.args
+        if not args:
+            return {}
+        if isinstance(args, dict):
+            return args
+        if hasattr(args, "keys") and hasattr(args, "__getitem__"):
+            return LazyArgsDict(args)
+        return {}
+    
+    @staticmethod
+    def _summary_fingerprint(image: Optional[np.ndarray],
+                             detection: Dict[str, Any],
+                             state_summary: Dict[str, Any],
+                             last_action_result: Optional[Dict[str, Any]]) -> int:
+        """
+        Hash the few fields that drive the next decision into a single int.
+        
+        Uses a coarse signature of the camera frame, found, area_ratio bucketed to
+        2 digits, phase and the last action name. The detector fields alone are
+        nearly constant (found is False and phase "unknown" without a detector), so
+        the frame signature is what ties a cached plan to what the camera saw
+        (image=None leaves it out, as the speculative prefetch match does).
+        The built-in tuple hash is enough for an in-process, non-adversarial cache.
+        """
+        return hash((
+            _image_signature(image),
+            bool(detection.get('found')),
+            round(detection.get('area_ratio') or 0.0, 2),
+            state_summary.get('phase'),
+            last_action_result.get('action') if last_action_result else None,
+        ))
     
     def plan(self, 
              image: Optional[np.ndarray],
@@ -129,7 +1185,7 @@ class GeminiPolicy:
              state_summary: Dict[str, Any],
              last_action_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
-        Plan next action using Gemini.
+        Plan next action using Gemini (blocking wrapper around plan_async).
         
         Args:
             image: Current camera frame
@@ -139,13 +1195,161 @@ class GeminiPolicy:
         
         Returns:
             Action plan dict with "action", "params", "phase", "why"
+        
+        Raises:
+            RuntimeError: If the policy was closed (its event loop stopped)
+        """
+        future = self.submit_plan(image, detection, state_summary, last_action_result)
+        while True:
+            try:
+                return future.result(timeout=1.0)
+            except concurrent.futures.TimeoutError:
+                # A loop stopped by close() would never resolve the future
+                if not self._loop.is_running():
+                    future.cancel()
+                    raise RuntimeError("Gemini policy is closed")
+    
+    def submit_plan(self,
+                    image: Optional[np.ndarray],
+                    detection: Dict[str, Any],
+                    state_summary: Dict[str, Any],
+                    last_action_result: Optional[Dict[str, Any]] = None) -> concurrent.futures.Future:
+        """
+        Start planning on the policy's event loop without waiting for the result.
+        
+        Cancelling the returned future cancels the request.
+        
+        Args: same as plan()
+        
+        Returns:
+            Future resolving to the action plan dict
+        
+        Raises:
+            RuntimeError: If the policy was closed (its event loop stopped)
+        """
+        if not self._loop.is_running():
+            raise RuntimeError("Gemini policy is closed")
+        return asyncio.run_coroutine_threadsafe(
+            self._plan_on_loop(image, detection, state_summary, last_action_result), self._loop
+        )
+    
+    async def plan_async(self,
+                         image: Optional[np.ndarray],
+                         detection: Dict[str, Any],
+                         state_summary: Dict[str, Any],
+                         last_action_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Plan next action using Gemini without blocking the caller's event loop.
+        
+        The request always runs on the policy's own event loop (the async GenAI
+        client is bound to it), so this can be awaited from any loop, e.g. with
+        asyncio.gather alongside frame capture.
+        
+        Args/Returns: same as plan()
         """
+        coro = self._plan_on_loop(image, detection, state_summary, last_action_result)
+        if asyncio.get_running_loop() is self._loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+    
+    async def _reset_on_loop(self):
+        """Drop any speculative plan (runs on self._loop). Context caches are kept for reuse."""
+        self._discard_pending_plan()
+    
+    async def _plan_on_loop(self,
+                            image: Optional[np.ndarray],
+                            detection: Dict[str, Any],
+                            state_summary: Dict[str, Any],
+                            last_action_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Plan on self._loop, using (and refilling) the speculative prefetch if enabled."""
+        action_plan = None
+        if self._pending_plan is not None:
+            # Matched without the frame: any action that moves the camera changes it
+            fingerprint = self._summary_fingerprint(None, detection, state_summary, last_action_result)
+            if fingerprint == self._pending_fingerprint:
+                pending = self._pending_plan
+                self._pending_plan = None
+                self._pending_messages = None
+                if not pending.cancelled():
+                    action_plan = await pending
+                    planner_trace.info("  → Using speculative plan: %s", action_plan.get('action'))
+            else:
+                self._discard_pending_plan()
+        
+        if action_plan is None:
+            action_plan = await self._plan_request(image, detection, state_summary, last_action_result)
+        
+        if self.speculative_prefetch and self.predict_next_state is not None:
+            self._start_speculative_plan(image, detection, state_summary, action_plan)
+        return action_plan
+    
+    def _start_speculative_plan(self, image, detection, state_summary, action_plan):
+        """Schedule a plan request for the predicted post-action state (runs on self._loop)."""
+        try:
+            predicted = self.predict_next_state(image, detection, state_summary, action_plan)
+        except Exception as e:
+            print(f"Warning: predict_next_state failed: {e}")
+            predicted = None
+        if predicted is None:
+            return
+        next_detection, next_state, next_result = predicted
+        self._pending_fingerprint = self._summary_fingerprint(None, next_detection, next_state, next_result)
+        self._pending_messages = list(self.messages)
+        self._pending_evicted_counts = self._evicted_action_counts.copy()
+        self._pending_delta_state = (self._last_state_text, self._turns_since_full_state)
+        self._pending_plan = asyncio.ensure_future(
+            self._plan_request(image, next_detection, next_state, next_result)
+        )
+    
+    def _discard_pending_plan(self):
+        """
+        Cancel an unused speculative plan and undo its conversation-history update.
+        
+        Must run on self._loop. The cancelled task is suspended at an await, so it
+        cannot touch self.messages again after this returns.
+        """
+        if self._pending_plan is None:
+            return
+        self._pending_plan.cancel()
+        self._pending_plan = None
+        snapshot = self._pending_messages
+        self._pending_messages = None
+        if snapshot is None:
+            return
+        current_ids = {id(msg) for msg in self.messages}
+        snapshot_ids = {id(msg) for msg in snapshot}
+        for msg in self.messages:
+            if id(msg) not in snapshot_ids:
+                self._release_image_bytes(msg)
+        for msg in snapshot:
+            if id(msg) not in current_ids:
+                for part in msg.parts or ():
+                    if part.inline_data is not None and part.inline_data.data:
+                        self._intern_image_bytes(part.inline_data.data)
+        self.messages = snapshot
+        self._evicted_action_counts = self._pending_evicted_counts
+        # The next delta prompt must be relative to a state Gemini actually saw
+        self._last_state_text, self._turns_since_full_state = self._pending_delta_state
+    
+    async def _plan_request(self,
+                            image: Optional[np.ndarray],
+                            detection: Dict[str, Any],
+                            state_summary: Dict[str, Any],
+                            last_action_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Build the prompt, call Gemini and parse the action plan; runs on self._loop."""
+        # Cheap fingerprint of the decision-relevant state (keys caches and short-circuits)
+        fingerprint = self._summary_fingerprint(image, detection, state_summary, last_action_result)
+        
         # Update current task if provided
         task_desc = state_summary.get('task', '')
         if task_desc and task_desc != self.current_task:
             self.current_task = task_desc
-            # Update system prompt with task description
-            self.system_prompt = get_system_prompt(task_description=task_desc)
+            # Cached plans were learned for another task
+            self._template_cache.clear()
+            # Task goes in the first user turn so the system prompt stays cacheable
+            self._task_content = genai_types.Content(
+                role="user", parts=[_Part_from_text(text=get_task_message(task_desc))]
+            )
         
         # Format state summary
         state_text = format_state_summary(state_summary)
@@ -154,22 +1358,52 @@ class GeminiPolicy:
         if last_action_result:
             state_text += f"\nLast action result: {last_action_result}"
         
+        # Delta mode: send only the changes, with a full state every full_state_every turns
+        prompt_state_text = state_text
+        if self.delta_state:
+            if self._last_state_text is not None and self._turns_since_full_state < self.full_state_every - 1:
+                prompt_state_text = format_state_delta(state_text, self._last_state_text)
+                self._turns_since_full_state += 1
+            else:
+                self._turns_since_full_state = 0
+            self._last_state_text = state_text
+        
         # Build conversation history context
         # Include previous observations, plans, actions, and results
         history_context = self._build_history_context(state_summary, last_action_result)
         
         # Combine history context with current state
         if history_context:
-            user_message = f"{history_context}\n\n--- Current State ---\n{state_text}"
+            user_message = f"{history_context}\n\n--- Current State ---\n{prompt_state_text}"
         else:
-            user_message = state_text
+            user_message = prompt_state_text
+        if self.max_action_chunk > 1:
+            user_message += (f"\n\nYou may call up to {self.max_action_chunk} functions in order. "
+                             "Calls after the first run without a new observation, so only add "
+                             "moves whose outcome you can predict.")
+        
+        # Reuse a recent plan for the same state if template caching is enabled
+        # (recorded in the history like a Gemini answer, so the next turn sees it)
+        if self.template_cache_enabled:
+            cached_plan = self._lookup_template(fingerprint, state_summary.get("iteration", 0))
+            if cached_plan is not None:
+                planner_trace.info("  → Template cache hit: %s", cached_plan['action'])
+                self._update_conversation_history(
+                    user_message=user_message,
+                    image=image,
+                    response_text=None,
+                    function_call=genai_types.FunctionCall(name=cached_plan["action"],
+                                                           args=cached_plan["params"]),
+                    action_plan=cached_plan,
+                    action_result=last_action_result
+                )
+                return cached_plan
         
         # Format state summary (system prompt will be in config, not in prompt)
         # Prepare contents using Content object with parts
-        from google.genai import types
         
         # Build parts list with state summary (system prompt goes to config)
-        parts = [types.Part.from_text(text=user_message)]
+        parts = [_Part_from_text(text=user_message)]
         
         # Track image info for logging
         image_info = None
@@ -186,10 +1420,10 @@ class GeminiPolicy:
                 if not hasattr(self, '_last_image_shape') or self._last_image_shape != image_shape:
                     if image_shape and len(image_shape) >= 2:
                         height, width = image_shape[0], image_shape[1]
-                        print(f"  → Full resolution: {width}x{height} (current image, quality=95)")
+                        print(f"  → Current image: {width}x{height} (long edge capped at {self.max_image_dim}, quality={self.image_jpeg_quality})")
                     self._last_image_shape = image_shape
                 # Add image as Part
-                parts.append(types.Part.from_bytes(
+                parts.append(_Part_from_bytes(
                     data=image_bytes,
                     mime_type="image/jpeg"
                 ))
@@ -202,10 +1436,14 @@ class GeminiPolicy:
         # Build conversation history: include previous messages + current message
         # This allows Gemini to understand the full context of the task execution
         # IMPORTANT: History messages contain COMPRESSED images (320x240, quality=70)
-        #            Current message contains FULL RESOLUTION image (original size, quality=95)
+        #            Current message contains the near full resolution image (long edge <= max_image_dim, quality=80)
         #            This reduces token usage while maintaining accuracy for current observation
         all_contents = []
         
+        # Task message first: a fixed prefix for the whole run
+        if self._task_content is not None:
+            all_contents.append(self._task_content)
+        
         # Add previous conversation history (if any)
         # Note: History is already limited to max_history_messages in _update_conversation_history
         # History images are compressed (compress=True) to save tokens
@@ -214,311 +1452,60 @@ class GeminiPolicy:
         
         # Add current message with FULL RESOLUTION image
         # Current image uses compress=False (full resolution) for maximum accuracy
-        current_content = types.Content(parts=parts)
+        current_content = genai_types.Content(parts=parts)
         all_contents.append(current_content)
         
         # Use all contents (history + current) for the API call
         contents = all_contents
         
-        try:
-            # Convert tool descriptions to FunctionDeclarations
-            tool_descs = get_tool_descriptions()
-            function_declarations = []
-            for tool_desc in tool_descs:
-                # Convert parameters dict to Schema using parametersJsonSchema
-                params_dict = tool_desc["parameters"]
-                func_decl = types.FunctionDeclaration(
-                    name=tool_desc["name"],
-                    description=tool_desc["description"],
-                    parametersJsonSchema=params_dict
-                )
-                function_declarations.append(func_decl)
-            
-            # Create Tool with functionDeclarations
-            tools = [types.Tool(functionDeclarations=function_declarations)]
-            
-            # Build config with system instruction
-            config = types.GenerateContentConfig(
-                temperature=0.3,
-                systemInstruction=self.system_prompt,  # System prompt in config
-                tools=tools if function_declarations else None,
-                httpOptions=types.HttpOptions(timeout=120000)  # 120 seconds = 120000 milliseconds
-            )
+        try:
+            # Tools and config are cached; config is rebuilt only when the system prompt changes
+            function_declarations = self._function_declarations
+            if self.context_cache_enabled and not self.structured_output:
+                self._cached_content_name = await self._ensure_context_cache(self.system_prompt)
+            else:
+                self._cached_content_name = None
+            config = self._get_config()
             
             # Prepare detailed prompt log
-            full_prompt = f"{self.system_prompt}\n\n{user_message}"  # Combined for logging (includes history)
             prompt_log = {
                 "model": self.model_name,
-                "system_prompt": self.system_prompt,
+                # System prompt is written once per session (system_prompt_<hash>.txt)
+                "system_prompt_ref": self._system_prompt_ref(),
                 "state_summary": state_text,
                 "history_context": history_context if history_context else None,
-                "full_prompt": full_prompt,
+                "full_prompt": user_message,  # User turn incl. history context (system prompt via ref)
                 "num_history_messages": len(self.messages),
                 "image_info": image_info,
-                "tools": [
-                    {
-                        "name": tool_desc["name"],
-                        "description": tool_desc["description"],
-                        "parameters": tool_desc["parameters"]
-                    }
-                    for tool_desc in tool_descs
-                ],
+                "tools_ref": self._tools_ref(),
                 "config": {
                     "temperature": 0.3,
                     "has_tools": len(function_declarations) > 0,
-                    "num_tools": len(function_declarations)
+                    "num_tools": len(function_declarations),
+                    "structured_output": self.structured_output,
+                    "cached_content": config.cached_content
                 },
                 "iteration": state_summary.get("iteration", 0),
-                "task": state_summary.get("task", "unknown")
+                "task": state_summary.get("task", "unknown"),
+                "state_fingerprint": fingerprint
             }
             
             # Log prompt to file
             self._log_prompt(prompt_log)
             
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=contents,
-                config=config
-            )
-            
-            # Extract response text (thinking process) and function calls
-            # IMPORTANT: Extract ALL text parts first, then function calls
-            # This ensures we capture the full reasoning process
-            response_text = ""
-            function_call = None
-            
-            # Method 1: Check candidates (most common path)
-            if hasattr(response, 'candidates') and len(response.candidates) > 0:
-                candidate = response.candidates[0]
-                if hasattr(candidate, 'content') and candidate.content:
-                    parts = candidate.content.parts
-                    # Process all parts to extract both text and function calls
-                    for part in parts:
-                        # Extract text (thinking process) - collect ALL text
-                        if hasattr(part, 'text') and part.text:
-                            if response_text:
-                                response_text += "\n" + part.text
-                            else:
-                                response_text = part.text
-                        # Extract function call (only the last one if multiple)
-                        if hasattr(part, 'function_call') and part.function_call:
-                            function_call = part.function_call
-            
-            # Method 2: Check for function calls directly in response (fallback)
-            if not function_call and hasattr(response, 'function_calls') and response.function_calls:
-                function_call = response.function_calls[0]
-            
-            # Method 3: Try to get text from response directly (additional fallback)
-            if not response_text and hasattr(response, 'text') and response.text:
-                response_text = response.text
-            
-            # Log response with thinking process
-            # response_text contains the reasoning/thinking process
-            # function_call contains the actual action to execute
-            response_log = {
-                "has_function_call": function_call is not None,
-                "thinking_process": response_text if response_text else None,  # Reasoning/thinking process
-                "response_text": response_text,  # Keep for backward compatibility
-                "function_call": None
-            }
-            
-            # If we have a function call, use it
-            if function_call:
-                action_name = function_call.name
-                # Extract parameters
-                params = {}
-                if hasattr(function_call, 'args') and function_call.args:
-                    # Convert args to dict
-                    if isinstance(function_call.args, dict):
-                        params = function_call.args
-                    elif hasattr(function_call.args, '__dict__'):
-                        params = dict(function_call.args)
-                    else:
-                        # Try to convert protobuf message to dict
-                        try:
-                            params = {k: v for k, v in function_call.args.items()}
-                        except:
-                            params = {}
-                
-                response_log["function_call"] = {
-                    "name": action_name,
-                    "params": params
-                }
-                
-                # Log response
-                self._log_response(response_log, state_summary.get("iteration", 0))
-                
-                # Build action plan
-                # "why" and "thinking_process" fields contain the thinking process for debugging
-                # Only the function call (action + params) will be executed
-                action_plan = {
-                    "action": action_name,  # Only this is executed
-                    "params": params,  # Only this is executed
-                    "phase": state_summary.get("phase", "unknown"),
-                    "why": response_text or f"Gemini selected {action_name}",  # Thinking process for debugging
-                    "thinking_process": response_text  # Explicit field for thinking process
-                }
-                
-                # Update conversation history with current interaction
-                self._update_conversation_history(
-                    user_message=user_message,
-                    image=image,
-                    response_text=response_text,
-                    function_call=function_call,
-                    action_plan=action_plan,
-                    action_result=last_action_result
-                )
-                
-                return action_plan
-            
-            # Log response even if no function call
-            self._log_response(response_log, state_summary.get("iteration", 0))
-            
-            # Try to parse function call from text if no actual function_call was returned
-            # Sometimes Gemini describes the function call in text instead of using function calling
-            parsed_action = None
-            parsed_params = {}
-            
-            if response_text and not function_call:
-                parsed_action, parsed_params = self._parse_function_call_from_text(response_text)
-            
-            if parsed_action:
-                # Found function call in text, use it
-                print(f"⚠️  Warning: Function call parsed from text (Gemini didn't use function calling): {parsed_action}")
-                action_plan = {
-                    "action": parsed_action,
-                    "params": parsed_params,
-                    "phase": state_summary.get("phase", "unknown"),
-                    "why": response_text,
-                    "thinking_process": response_text
-                }
-                
-                # Update response log
-                response_log["function_call"] = {
-                    "name": parsed_action,
-                    "params": parsed_params,
-                    "parsed_from_text": True  # Flag to indicate this was parsed from text
-                }
-                self._log_response(response_log, state_summary.get("iteration", 0))
-                
-                # Update conversation history
-                self._update_conversation_history(
-                    user_message=user_message,
-                    image=image,
-                    response_text=response_text,
-                    function_call=None,  # No actual function_call object
-                    action_plan=action_plan,
-                    action_result=last_action_result
-                )
-                
-                return action_plan
-            
-            # No function call found (neither actual nor parsed from text)
-            # First, try to parse function call from text
-            parsed_action = None
-            parsed_params = {}
-            
-            if response_text and not function_call:
-                parsed_action, parsed_params = self._parse_function_call_from_text(response_text)
-            
-            if parsed_action:
-                # Found function call in text, use it
-                print(f"⚠️  Warning: Function call parsed from text (Gemini didn't use function calling): {parsed_action}")
-                action_plan = {
-                    "action": parsed_action,
-                    "params": parsed_params,
-                    "phase": state_summary.get("phase", "unknown"),
-                    "why": response_text,
-                    "thinking_process": response_text
-                }
-                
-                # Update response log
-                response_log["function_call"] = {
-                    "name": parsed_action,
-                    "params": parsed_params,
-                    "parsed_from_text": True  # Flag to indicate this was parsed from text
-                }
-                self._log_response(response_log, state_summary.get("iteration", 0))
-                
-                # Update conversation history
-                self._update_conversation_history(
-                    user_message=user_message,
-                    image=image,
-                    response_text=response_text,
-                    function_call=None,  # No actual function_call object
-                    action_plan=action_plan,
-                    action_result=last_action_result
-                )
-                
-                return action_plan
-            
-            # No function call found - check if Gemini declared task completion
-            # Check both response_text and thinking_process for completion keywords
-            completion_text = response_text or ""
-            # Also check thinking_process if available in response_log
-            if response_log.get("thinking_process"):
-                completion_text += " " + response_log["thinking_process"]
-            
-            if completion_text:
-                completion_keywords = [
-                    "task is complete", "task complete", "successfully completed",
-                    "successfully grasped", "task \"", "mission accomplished",
-                    "completed the task", "finished the task", "task has been completed",
-                    "successfully picked up", "successfully grabbed"
-                ]
-                completion_lower = completion_text.lower()
-                if any(keyword in completion_lower for keyword in completion_keywords):
-                    # Gemini declared completion - return special action to signal completion
-                    print(f"✓ Gemini declared task completion: {completion_text[:100]}...")
-                    action_plan = {
-                        "action": "task_complete",  # Special action to signal completion
-                        "params": {},
-                        "phase": "COMPLETE",
-                        "why": response_text or completion_text,
-                        "thinking_process": response_text or completion_text
-                    }
-                    
-                    # Update response log
-                    response_log["task_complete"] = True
-                    self._log_response(response_log, state_summary.get("iteration", 0))
-                    
-                    # Update conversation history
-                    self._update_conversation_history(
-                        user_message=user_message,
-                        image=image,
-                        response_text=response_text,
-                        function_call=None,
-                        action_plan=action_plan,
-                        action_result=last_action_result
-                    )
-                    
-                    return action_plan
-            
-            # No function call and no completion declaration - return safe fallback action
-            action_plan = {
-                "action": "base_stop",  # Safe fallback action
-                "params": {},
-                "phase": state_summary.get("phase", "unknown"),
-                "why": f"Gemini response: {response_text[:200] if response_text else 'No response'}",
-                "thinking_process": response_text  # Full thinking process for debugging
-            }
-            
-            # Update conversation history with current interaction
-            self._update_conversation_history(
-                user_message=user_message,
-                image=image,
-                response_text=response_text,
-                function_call=None,
-                action_plan=action_plan,
-                action_result=last_action_result
-            )
+            response = await self._generate_content_async(contents, config, state_summary.get("iteration", 0))
             
-            return action_plan
+            return self._plan_from_response(response, fingerprint, user_message, image,
+                                            state_summary, last_action_result)
         
         except Exception as e:
             error_msg = str(e)
             error_str = str(e)
             
+            # A missing/expired context cache makes every request fail - rebuild it next time
+            if self._cached_content_name and "cache" in error_str.lower():
+                self._drop_context_cache()
+            
             # Handle 429 RESOURCE_EXHAUSTED (quota exceeded) with retry
             if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower():
                 print(f"⚠️  API quota exceeded (429). Extracting retry delay from error message...")
@@ -526,8 +1513,6 @@ class GeminiPolicy:
                 # Extract retry delay from error message
                 # Format: "Please retry in 14.408981893s" or "retryDelay": "14s"
                 retry_delay = None
-                import re
-                import json
                 
                 # Method 1: Try to parse from error message text
                 # Pattern: "Please retry in X.XXs" or "retry in X.XX s"
@@ -578,128 +1563,20 @@ class GeminiPolicy:
                     print(f"  → Extracted retry delay: {retry_delay:.2f}s")
                 
                 # Wait for the specified retry delay
-                import time
                 print(f"  → Waiting {retry_delay:.2f}s before retry (as specified in error message)...")
-                time.sleep(retry_delay)
+                await asyncio.sleep(retry_delay)
                 
                 try:
                     # Retry with reduced history
                     print("  → Retrying API call with reduced history...")
-                    response = self.client.models.generate_content(
-                        model=self.model_name,
-                        contents=contents,
-                        config=config
-                    )
+                    response = await self._generate_content_async(contents, config, state_summary.get("iteration", 0))
                     
-                    # If retry succeeds, continue with normal processing
-                    # Extract response text and function calls (same as before)
-                    response_text = ""
-                    function_call = None
-                    
-                    if hasattr(response, 'candidates') and len(response.candidates) > 0:
-                        candidate = response.candidates[0]
-                        if hasattr(candidate, 'content') and candidate.content:
-                            parts = candidate.content.parts
-                            for part in parts:
-                                if hasattr(part, 'text') and part.text:
-                                    if response_text:
-                                        response_text += "\n" + part.text
-                                    else:
-                                        response_text = part.text
-                                if hasattr(part, 'function_call') and part.function_call:
-                                    function_call = part.function_call
-                    
-                    if not function_call and hasattr(response, 'function_calls') and response.function_calls:
-                        function_call = response.function_calls[0]
-                    
-                    if not response_text and hasattr(response, 'text') and response.text:
-                        response_text = response.text
-                    
-                    # Process response (same logic as main path)
-                    response_log = {
-                        "has_function_call": function_call is not None,
-                        "thinking_process": response_text if response_text else None,
-                        "response_text": response_text,
-                        "function_call": None
-                    }
-                    
-                    if function_call:
-                        action_name = function_call.name
-                        params = {}
-                        if hasattr(function_call, 'args') and function_call.args:
-                            if isinstance(function_call.args, dict):
-                                params = function_call.args
-                            elif hasattr(function_call.args, '__dict__'):
-                                params = dict(function_call.args)
-                            else:
-                                try:
-                                    params = {k: v for k, v in function_call.args.items()}
-                                except:
-                                    params = {}
-                        
-                        response_log["function_call"] = {"name": action_name, "params": params}
-                        self._log_response(response_log, state_summary.get("iteration", 0))
-                        
-                        action_plan = {
-                            "action": action_name,
-                            "params": params,
-                            "phase": state_summary.get("phase", "unknown"),
-                            "why": response_text or f"Gemini selected {action_name}",
-                            "thinking_process": response_text
-                        }
-                        
-                        self._update_conversation_history(
-                            user_message=user_message,
-                            image=image,
-                            response_text=response_text,
-                            function_call=function_call,
-                            action_plan=action_plan,
-                            action_result=last_action_result
-                        )
-                        
-                        print("  ✓ Retry successful!")
-                        return action_plan
-                    else:
-                        # No function call in retry response, try parsing from text
-                        parsed_action, parsed_params = self._parse_function_call_from_text(response_text)
-                        if parsed_action:
-                            print(f"  → Parsed function call from text: {parsed_action}")
-                            action_plan = {
-                                "action": parsed_action,
-                                "params": parsed_params,
-                                "phase": state_summary.get("phase", "unknown"),
-                                "why": response_text,
-                                "thinking_process": response_text
-                            }
-                            response_log["function_call"] = {
-                                "name": parsed_action,
-                                "params": parsed_params,
-                                "parsed_from_text": True
-                            }
-                            self._log_response(response_log, state_summary.get("iteration", 0))
-                            self._update_conversation_history(
-                                user_message=user_message,
-                                image=image,
-                                response_text=response_text,
-                                function_call=None,
-                                action_plan=action_plan,
-                                action_result=last_action_result
-                            )
-                            print("  ✓ Retry successful (parsed from text)!")
-                            return action_plan
-                        else:
-                            # No function call found
-                            self._log_response(response_log, state_summary.get("iteration", 0))
-                            action_plan = {
-                                "action": "base_stop",
-                                "params": {},
-                                "phase": state_summary.get("phase", "unknown"),
-                                "why": f"Gemini response (after retry): {response_text[:200] if response_text else 'No response'}",
-                                "thinking_process": response_text
-                            }
-                            print("  ⚠️  Retry succeeded but no function call returned")
-                            return action_plan
-                        
+                    # If retry succeeds, continue with normal processing (same logic as main path)
+                    action_plan = self._plan_from_response(response, fingerprint, user_message, image,
+                                                           state_summary, last_action_result)
+                    print("  ✓ Retry successful!")
+                    return action_plan
+                
                 except Exception as retry_error:
                     retry_error_str = str(retry_error)
                     if "429" in retry_error_str or "RESOURCE_EXHAUSTED" in retry_error_str:
@@ -720,90 +1597,508 @@ class GeminiPolicy:
             
             # Fallback: use simple heuristic based on detection
             # If target found but small, approach; if large, use arm; if not found, search
-            if detection.get('found'):
-                area_ratio = detection.get('area_ratio', 0.0)
-                if area_ratio < 0.05:
-                    # Target far, approach
-                    return {
-                        "action": "base_step",
-                        "params": {
-                            "velocity": 50.0,
-                            "direction": 0.0,
-                            "angular_rate": 0.0,
-                            "duration": 0.3
-                        },
-                        "phase": state_summary.get("phase", "unknown"),
-                        "why": f"API timeout fallback: approaching target (area={area_ratio:.4f})"
-                    }
-                else:
-                    # Target close, use arm
-                    return {
-                        "action": "arm_to_safe_pose",
-                        "params": {},
-                        "phase": state_summary.get("phase", "unknown"),
-                        "why": f"API timeout fallback: target close (area={area_ratio:.4f}), moving arm"
+            found = bool(detection.get('found'))
+            area_ratio = detection.get('area_ratio', 0.0) if found else 0.0
+            template = self._FALLBACK_TABLE[(found, found and area_ratio < 0.05)]
+            fallback_plan = dict(template)
+            fallback_plan["params"] = dict(template["params"])
+            fallback_plan["phase"] = state_summary.get("phase", "unknown")
+            fallback_plan["why"] = template["why"].format(area_ratio=area_ratio)
+            return fallback_plan
+    
+    def _plan_from_response(self, response, fingerprint: int, user_message: str,
+                            image: Optional[np.ndarray],
+                            state_summary: Dict[str, Any],
+                            last_action_result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Turn a Gemini response into an action plan, log it and update the history.
+        
+        Shared by the normal path and the 429 retry of _plan_request. Falls back to a
+        call parsed from the text, a declared completion, or base_stop.
+        
+        Returns:
+            Action plan dict with "action", "params", "phase", "why"
+            (plus "completion" / "action_chunk" when applicable)
+        """
+        # Extract response text (thinking process) and function call
+        response_text, function_call = self._extract_response(response)
+        if self.structured_output and function_call is None:
+            response_text, function_call = self._parse_structured_response(response_text)
+        # Action chunk: the first call is executed now, the rest are queued by the executor
+        chunk_calls = []
+        if self.max_action_chunk > 1 and function_call is not None:
+            chunk_calls = self._extract_function_calls(response)[:self.max_action_chunk]
+            if len(chunk_calls) > 1:
+                function_call = chunk_calls[0]
+        
+        # Log response with thinking process
+        # response_text contains the reasoning/thinking process
+        # function_call contains the actual action to execute
+        response_log = {
+            "has_function_call": function_call is not None,
+            "thinking_process": response_text if response_text else None,  # Reasoning/thinking process
+            "response_text": response_text,  # Keep for backward compatibility
+            "function_call": None
+        }
+        
+        # If we have a function call, use it
+        if function_call:
+            action_name = function_call.name
+            # Extract parameters
+            params = self._function_call_params(function_call)
+            
+            response_log["function_call"] = {
+                "name": action_name,
+                "params": params
+            }
+            
+            # Build action plan
+            # "why" and "thinking_process" fields contain the thinking process for debugging
+            # Only the function call (action + params) will be executed
+            action_plan = {
+                "action": action_name,  # Only this is executed
+                "params": params,  # Only this is executed
+                "phase": state_summary.get("phase", "unknown"),
+                "why": response_text or f"Gemini selected {action_name}",  # Thinking process for debugging
+                "thinking_process": response_text  # Explicit field for thinking process
+            }
+            if action_name == "task_complete":
+                action_plan["completion"] = {
+                    "completed": True,
+                    "confidence": float(params.get("confidence", 0.0)),
+                    "reason": params.get("reason", ""),
+                    "evidence": params.get("evidence", "")
+                }
+            if len(chunk_calls) > 1:
+                action_plan["action_chunk"] = [
+                    {
+                        "action": call.name,
+                        "params": self._function_call_params(call),
+                        "phase": action_plan["phase"],
+                        "why": f"Queued step {index} of {len(chunk_calls)} from iteration "
+                               f"{state_summary.get('iteration', 0)}",
+                        "thinking_process": None
                     }
-            else:
-                # Target not found, search
-                return {
-                    "action": "base_step",
-                    "params": {
-                        "velocity": 0.0,
-                        "direction": 0.0,
-                        "angular_rate": 15.0,  # Rotate
-                        "duration": 0.3
-                    },
-                    "phase": state_summary.get("phase", "unknown"),
-                    "why": "API timeout fallback: target not found, searching"
+                    for index, call in enumerate(chunk_calls[1:], start=2)
+                ]
+                response_log["action_chunk"] = action_plan["action_chunk"]
+            
+            # Log response
+            self._log_response(response_log, state_summary.get("iteration", 0))
+            
+            if self.template_cache_enabled:
+                self._store_template(fingerprint, action_plan, state_summary.get("iteration", 0))
+            
+            # Update conversation history with current interaction
+            self._update_conversation_history(
+                user_message=user_message,
+                image=image,
+                response_text=response_text,
+                function_call=function_call,
+                action_plan=action_plan,
+                action_result=last_action_result,
+                queued_function_calls=chunk_calls[1:]
+            )
+            
+            return action_plan
+        
+        # Log response even if no function call
+        self._log_response(response_log, state_summary.get("iteration", 0))
+        
+        # Try to parse function call from text if no actual function_call was returned
+        # Sometimes Gemini describes the function call in text instead of using function calling
+        parsed_action = None
+        parsed_params = {}
+        
+        if response_text and not function_call:
+            parsed_action, parsed_params = self._parse_function_call_from_text(response_text)
+        
+        if parsed_action:
+            # Found function call in text, use it
+            print(f"⚠️  Warning: Function call parsed from text (Gemini didn't use function calling): {parsed_action}")
+            action_plan = {
+                "action": parsed_action,
+                "params": parsed_params,
+                "phase": state_summary.get("phase", "unknown"),
+                "why": response_text,
+                "thinking_process": response_text
+            }
+            
+            # Update response log
+            response_log["function_call"] = {
+                "name": parsed_action,
+                "params": parsed_params,
+                "parsed_from_text": True  # Flag to indicate this was parsed from text
+            }
+            self._log_response(response_log, state_summary.get("iteration", 0))
+            
+            # Update conversation history
+            self._update_conversation_history(
+                user_message=user_message,
+                image=image,
+                response_text=response_text,
+                function_call=None,  # No actual function_call object
+                action_plan=action_plan,
+                action_result=last_action_result
+            )
+            
+            return action_plan
+        
+        # No function call found - check if Gemini declared task completion
+        # Check both response_text and thinking_process for completion keywords
+        completion_text = response_text or ""
+        # Also check thinking_process if available in response_log
+        if response_log.get("thinking_process"):
+            completion_text += " " + response_log["thinking_process"]
+        
+        if completion_text:
+            completion_keywords = [
+                "task is complete", "task complete", "successfully completed",
+                "successfully grasped", "task \"", "mission accomplished",
+                "completed the task", "finished the task", "task has been completed",
+                "successfully picked up", "successfully grabbed"
+            ]
+            completion_lower = completion_text.lower()
+            if any(keyword in completion_lower for keyword in completion_keywords):
+                # Gemini declared completion - return special action to signal completion
+                print(f"✓ Gemini declared task completion: {completion_text[:100]}...")
+                action_plan = {
+                    "action": "task_complete",  # Special action to signal completion
+                    "params": {},
+                    "phase": "COMPLETE",
+                    "why": response_text or completion_text,
+                    "thinking_process": response_text or completion_text
                 }
+                
+                # Update response log
+                response_log["task_complete"] = True
+                self._log_response(response_log, state_summary.get("iteration", 0))
+                
+                # Update conversation history
+                self._update_conversation_history(
+                    user_message=user_message,
+                    image=image,
+                    response_text=response_text,
+                    function_call=None,
+                    action_plan=action_plan,
+                    action_result=last_action_result
+                )
+                
+                return action_plan
+        
+        # No function call and no completion declaration - return safe fallback action
+        action_plan = {
+            "action": "base_stop",  # Safe fallback action
+            "params": {},
+            "phase": state_summary.get("phase", "unknown"),
+            "why": f"Gemini response: {response_text[:200] if response_text else 'No response'}",
+            "thinking_process": response_text  # Full thinking process for debugging
+        }
+        
+        # Update conversation history with current interaction
+        self._update_conversation_history(
+            user_message=user_message,
+            image=image,
+            response_text=response_text,
+            function_call=None,
+            action_plan=action_plan,
+            action_result=last_action_result
+        )
+        
+        return action_plan
+    
+    async def _keepalive_loop(self):
+        """Ping the API while idle so the next plan() does not pay a new TLS handshake."""
+        while self.keepalive_interval_s:
+            idle_s = time.monotonic() - self._last_request_time
+            if idle_s < self.keepalive_interval_s:
+                await asyncio.sleep(self.keepalive_interval_s - idle_s)
+                continue
+            self._last_request_time = time.monotonic()
+            try:
+                await self.client.aio.models.get(model=self.model_name)
+            except Exception as e:
+                gemini_logger.debug(f"Keep-alive ping failed: {e}")
+        self._keepalive_task = None
+    
+    async def _request(self, model: str, contents, config, iteration: Optional[int]):
+        """
+        One Gemini request: streamed with early exit if stream_responses, else a plain call.
+        
+        The stream is left once max_action_chunk function calls have arrived; with action
+        chunks enabled a response with fewer calls is read to the end.
+        """
+        if not self.stream_responses:
+            return await self.client.aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config
+            )
+        
+        stream = await self.client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config
+        )
+        parts = []
+        function_calls = 0
+        async for chunk in stream:
+            chunk_parts = self._chunk_parts(chunk)
+            parts.extend(chunk_parts)
+            function_calls += sum(1 for part in chunk_parts if part.function_call)
+            if function_calls >= self.max_action_chunk:
+                # The action (or a full action chunk) is known - finish reading the tail in the background
+                task = asyncio.ensure_future(self._drain_stream(stream, iteration))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+                break
+        return genai_types.GenerateContentResponse(candidates=[genai_types.Candidate(
+            content=genai_types.Content(role="model", parts=self._merge_text_parts(parts))
+        )])
+    
+    @staticmethod
+    def _chunk_parts(chunk) -> list:
+        candidates = chunk.candidates
+        if not candidates or not candidates[0].content:
+            return []
+        return list(candidates[0].content.parts or ())
+    
+    @staticmethod
+    def _merge_text_parts(parts: list) -> list:
+        """Join consecutive streamed text fragments back into whole text parts."""
+        merged = []
+        for part in parts:
+            previous = merged[-1] if merged else None
+            if (part.text and previous is not None and previous.text
+                    and not part.function_call and not previous.function_call
+                    and part.thought == previous.thought):
+                merged[-1] = genai_types.Part(text=previous.text + part.text, thought=part.thought)
+            else:
+                merged.append(part)
+        return merged
+    
+    async def _drain_stream(self, stream, iteration: Optional[int]):
+        """Read the rest of an early-exited stream and log it as response_XXXXX_tail.json."""
+        parts = []
+        try:
+            async for chunk in stream:
+                parts.extend(self._chunk_parts(chunk))
+        except Exception as e:
+            gemini_logger.debug(f"Stream tail read failed: {e}")
+        if not parts or iteration is None or not self.current_log_dir:
+            return
+        parts = self._merge_text_parts(parts)
+        tail_log = {
+            "tail_text": "\n".join(part.text for part in parts if part.text) or None,
+            "extra_function_calls": [
+                {"name": part.function_call.name, "params": part.function_call.args}
+                for part in parts if part.function_call
+            ]
+        }
+        self._write_log_file(
+            self.current_log_dir / "gemini_prompts" / f"response_{iteration:05d}_tail.json",
+            _dumps_log(tail_log), "response tail"
+        )
+    
+    async def _generate_content_async(self, contents, config, iteration: Optional[int] = None):
+        """
+        Call Gemini asynchronously, hedging with the fallback model when the primary is slow.
+        
+        Waits hedge_after_s for the primary model. If it has not answered yet (or
+        failed, e.g. 429/5xx) and fallback_model_name is set, the fallback request is
+        started and the first successful response wins. The fallback never uses the
+        primary's context cache. Raises TimeoutError after request_timeout_s.
+        """
+        if self.batch_dispatcher is not None:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(self.batch_dispatcher.submit(
+                    self.model_name, contents, config,
+                    self._get_config(inline=True) if config.cached_content else config
+                )),
+                timeout=self.request_timeout_s
+            )
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.request_timeout_s
+        self._last_request_time = time.monotonic()
+        if self.keepalive_interval_s and self._keepalive_task is None:
+            self._keepalive_task = asyncio.ensure_future(self._keepalive_loop())
+        tasks = {asyncio.ensure_future(self._request(self.model_name, contents, config, iteration))}
+        hedged = self.fallback_model_name is None
+        last_error = None
+        
+        try:
+            while tasks:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                wait_s = remaining if hedged else min(remaining, self.hedge_after_s)
+                done, tasks = await asyncio.wait(tasks, timeout=wait_s, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    if not hedged:
+                        # Primary is slow - race the fallback model against it
+                        hedged = True
+                        print(f"  → {self.model_name} slower than {self.hedge_after_s:.1f}s, "
+                              f"racing {self.fallback_model_name}")
+                        tasks.add(self._start_fallback(contents, config, iteration))
+                    continue
+                
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                if not hedged and not tasks:
+                    # Primary failed fast - try the fallback model instead
+                    hedged = True
+                    print(f"  → {self.model_name} failed ({last_error}), trying {self.fallback_model_name}")
+                    tasks.add(self._start_fallback(contents, config, iteration))
+            
+            if last_error is not None and not tasks:
+                raise last_error
+            raise TimeoutError(f"Gemini request timed out after {self.request_timeout_s:.0f}s")
+        finally:
+            # Drop the losing (or timed out) requests
+            for task in tasks:
+                task.cancel()
+    
+    def _start_fallback(self, contents, config, iteration: Optional[int]) -> asyncio.Future:
+        """Start the fallback-model request (inline config: the context cache belongs to the primary model)."""
+        if config.cached_content:
+            config = self._get_config(inline=True)
+        return asyncio.ensure_future(self._request(self.fallback_model_name, contents, config, iteration))
     
     def reset(self):
         """Reset conversation history."""
+        self.flush_logs()
+        if self._pending_plan is not None:
+            asyncio.run_coroutine_threadsafe(self._reset_on_loop(), self._loop).result()
         self.messages = []
+        self._image_bytes_cache.clear()
+        self._evicted_action_counts.clear()
+        self._template_cache.clear()
+        self._last_state_text = None
+        self._turns_since_full_state = 0
         self.current_task = None
+        self._task_content = None
         self.system_prompt = self.base_system_prompt
         # Don't clear current_log_dir here - it should be set by executor after reset
     
     def set_log_dir(self, log_dir: Path):
         """Set log directory for prompt logging."""
         self.current_log_dir = log_dir
+        self._logged_system_prompts = set()
+        self._logged_tools = False
         if log_dir:
             (log_dir / "gemini_prompts").mkdir(parents=True, exist_ok=True)
     
+    def _system_prompt_ref(self) -> Optional[str]:
+        """
+        Return the file name holding the current system prompt, writing it on first use.
+        
+        The system prompt is static, so it is logged once per session instead
+        of in every prompt_XXXXX.json.
+        """
+        if not self.current_log_dir:
+            return None
+        digest = hashlib.blake2b(self.system_prompt.encode('utf-8'), digest_size=6).hexdigest()
+        file_name = f"system_prompt_{digest}.txt"
+        if digest not in self._logged_system_prompts:
+            self._logged_system_prompts.add(digest)
+            self._write_log_file(self.current_log_dir / "gemini_prompts" / file_name,
+                                 self.system_prompt.encode('utf-8'), "system prompt")
+        return file_name
+    
+    def _tools_ref(self) -> Optional[str]:
+        """Return the file name holding the tool declarations, writing it on first use."""
+        if not self.current_log_dir:
+            return None
+        if not self._logged_tools:
+            self._logged_tools = True
+            self._write_log_file(self.current_log_dir / "gemini_prompts" / "tools.json",
+                                 self._tools_log_bytes, "tools")
+        return "tools.json"
+    
+    def _write_log_file(self, path: Path, data: bytes, what: str):
+        """Queue a log file write on the background log thread (drops the oldest write if full)."""
+        item = (path, data, what)
+        while True:
+            try:
+                self._log_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._log_queue.get_nowait()
+                    self._log_dropped += 1
+                    if self._log_dropped == 1 or self._log_dropped % 100 == 0:
+                        print(f"Warning: Gemini log writer is behind, dropped {self._log_dropped} log file(s)")
+                except queue.Empty:
+                    pass
+    
+    def _log_writer_loop(self):
+        """Background thread: write queued log files; (None, Event, None) flushes, None stops."""
+        while True:
+            item = self._log_queue.get()
+            if item is None:
+                return
+            path, data, what = item
+            if path is None:
+                data.set()  # Flush marker: everything queued before it is written
+                continue
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(data)
+            except Exception as e:
+                print(f"Warning: Failed to log {what}: {e}")
+    
+    def flush_logs(self, timeout_s: float = 5.0) -> bool:
+        """Wait until all queued prompt/response logs are written. Returns False on timeout."""
+        if not self._log_thread.is_alive():
+            return True
+        flushed = threading.Event()
+        self._log_queue.put((None, flushed, None))
+        return flushed.wait(timeout_s)
+    
+    def close(self):
+        """Flush logs, delete the context cache and stop the background threads."""
+        self.flush_logs()
+        if self._loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(self._close_on_loop(), self._loop).result(timeout=10.0)
+            except Exception as e:
+                print(f"Warning: Error while closing Gemini policy: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._log_thread.is_alive():
+            self._log_queue.put(None)
+    
+    async def _close_on_loop(self):
+        self._discard_pending_plan()
+        self._cached_content_name = None
+        names = [entry[0] for entry in self._context_caches.values()]
+        self._context_caches.clear()
+        for name in names:
+            await self._delete_context_cache(name)
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+    
     def _log_prompt(self, prompt_log: Dict[str, Any]):
-        """Log detailed prompt to file."""
+        """Log detailed prompt to file (serialized now, written in the background)."""
         if not self.current_log_dir:
             return
         
-        prompt_dir = self.current_log_dir / "gemini_prompts"
-        prompt_dir.mkdir(exist_ok=True)
-        
         iteration = prompt_log.get("iteration", 0)
-        prompt_file = prompt_dir / f"prompt_{iteration:05d}.json"
-        
-        try:
-            with open(prompt_file, 'w', encoding='utf-8') as f:
-                json.dump(prompt_log, f, indent=2, ensure_ascii=False, default=str)
-            print(f"Gemini prompt logged: {prompt_file}")
-        except Exception as e:
-            print(f"Warning: Failed to log prompt: {e}")
+        prompt_file = self.current_log_dir / "gemini_prompts" / f"prompt_{iteration:05d}.json"
+        # Serialize on the caller's thread: the dict may be mutated after this returns
+        self._write_log_file(prompt_file, _dumps_log(prompt_log), "prompt")
     
     def _log_response(self, response_log: Dict[str, Any], iteration: int):
-        """Log response to file."""
+        """Log response to file (serialized now, written in the background)."""
         if not self.current_log_dir:
             return
         
-        prompt_dir = self.current_log_dir / "gemini_prompts"
-        prompt_dir.mkdir(exist_ok=True)
-        
-        response_file = prompt_dir / f"response_{iteration:05d}.json"
-        
-        try:
-            with open(response_file, 'w', encoding='utf-8') as f:
-                json.dump(response_log, f, indent=2, ensure_ascii=False, default=str)
-            print(f"Gemini response logged: {response_file}")
-        except Exception as e:
-            print(f"Warning: Failed to log response: {e}")
+        response_file = self.current_log_dir / "gemini_prompts" / f"response_{iteration:05d}.json"
+        self._write_log_file(response_file, _dumps_log(response_log), "response")
     
     def _build_history_context(self, state_summary: Dict[str, Any], last_action_result: Optional[Dict[str, Any]]) -> str:
         """
@@ -818,6 +2113,10 @@ class GeminiPolicy:
         recent_messages = self.messages[-self.max_history_messages:] if len(self.messages) > self.max_history_messages else self.messages
         
         history_lines = ["--- Recent History (last 5 interactions) ---"]
+        # Older actions that left the window, as one stat line
+        evicted_summary = format_history(self._evicted_history_stats())
+        if evicted_summary:
+            history_lines.append(f"  {evicted_summary}")
         
         # Parse messages to extract ONLY essential information (keep it short!)
         # Messages alternate: user (observation + state) -> model (response + function call)
@@ -850,9 +2149,10 @@ class GeminiPolicy:
         result = "\n".join(history_lines)
         max_chars = 500  # Limit to ~125 tokens for history context
         if len(result) > max_chars:
-            # Keep only the most recent lines
+            # Keep only the most recent lines (and the summary of older ones)
             lines = result.split('\n')
-            result = "\n".join(lines[:1] + lines[-10:])  # Header + last 10 lines
+            head = 2 if evicted_summary else 1
+            result = "\n".join(lines[:head] + lines[max(head, len(lines) - 10):])  # Header + last 10 lines
         
         return result
     
@@ -862,70 +2162,111 @@ class GeminiPolicy:
                                     response_text: str,
                                     function_call: Optional[Any],
                                     action_plan: Dict[str, Any],
-                                    action_result: Optional[Dict[str, Any]]):
+                                    action_result: Optional[Dict[str, Any]],
+                                    queued_function_calls: Optional[List[Any]] = None):
         """
         Update conversation history with current interaction.
         
-        Stores user message (with image if available) and model response.
+        Stores user message (with image if available) and model response
+        (queued_function_calls: the rest of an action chunk, recorded after function_call).
         """
-        from google.genai import types
         
         # Build user message parts for history
         # IMPORTANT: History images are COMPRESSED (320x240, quality=70) to reduce token usage
         #            This is different from current images in plan() which use full resolution
-        user_parts = [types.Part.from_text(text=user_message)]
+        user_parts = [_Part_from_text(text=user_message)]
         if image is not None:
             try:
                 # Use compressed image for history to reduce token usage
                 # compress=True: resize to 320x240, quality=70, optimized
-                image_bytes = self._image_to_bytes(image, compress=True)
+                image_bytes = self._intern_image_bytes(self._image_to_bytes(image, compress=True))
                 original_size = image.shape[:2] if hasattr(image, 'shape') else None
                 compressed_size = len(image_bytes)
-                user_parts.append(types.Part.from_bytes(
+                user_parts.append(_Part_from_bytes(
                     data=image_bytes,
                     mime_type="image/jpeg"
                 ))
                 # Debug: log compression info
                 if original_size:
-                    print(f"  → History image compressed: {original_size[1]}x{original_size[0]} → {compressed_size} bytes")
+                    planner_trace.debug("  → History image compressed: %dx%d → %d bytes",
+                                        original_size[1], original_size[0], compressed_size)
             except Exception as e:
                 print(f"Warning: Failed to encode image for history: {e}")
         
         # Add user message to history
-        user_content = types.Content(parts=user_parts, role="user")
+        user_content = genai_types.Content(parts=user_parts, role="user")
         self.messages.append(user_content)
         
         # Build model response
         model_parts = []
         if response_text:
-            model_parts.append(types.Part.from_text(text=response_text))
-        if function_call:
+            model_parts.append(_Part_from_text(text=response_text))
+        for call in ([function_call] if function_call else []) + list(queued_function_calls or ()):
             # Add function call as text description for history
             # Include parameters so model can detect oscillation patterns (e.g., angular_rate alternating)
-            func_text = f"Function call: {function_call.name}("
-            if hasattr(function_call, 'args') and function_call.args:
-                if isinstance(function_call.args, dict):
+            func_text = f"Function call: {call.name}("
+            if hasattr(call, 'args') and call.args:
+                if isinstance(call.args, dict):
                     # Sort params for consistent display - this helps model see patterns
                     params_list = []
-                    for k, v in sorted(function_call.args.items()):
+                    for k, v in sorted(call.args.items()):
                         params_list.append(f"{k}={v}")
                     params_str = ", ".join(params_list)
                 else:
-                    params_str = str(function_call.args)
+                    params_str = str(call.args)
                 func_text += params_str
             func_text += ")"
-            model_parts.append(types.Part.from_text(text=func_text))
+            model_parts.append(_Part_from_text(text=func_text))
         
         if model_parts:
-            model_content = types.Content(parts=model_parts, role="model")
+            model_content = genai_types.Content(parts=model_parts, role="model")
             self.messages.append(model_content)
         
         # Limit history size to avoid token limit
         # This is the ONLY place where we actually trim the messages list
         # All other code should use self.messages directly (it's already limited here)
         if len(self.messages) > self.max_history_messages:
+            for evicted in self.messages[:-self.max_history_messages]:
+                self._release_image_bytes(evicted)
+                self._count_evicted_actions(evicted)
             self.messages = self.messages[-self.max_history_messages:]
     
+    def _count_evicted_actions(self, content) -> None:
+        """Fold the function calls of a message leaving the history into the summary counters."""
+        if content.role != "model":
+            return
+        for part in content.parts or ():
+            for match in _FUNCTION_CALL_LINE_RE.finditer(part.text or ""):
+                self._evicted_action_counts[_action_category(match.group(1), match.group(2))] += 1
+    
+    def _evicted_history_stats(self) -> Dict[str, Any]:
+        return {
+            "actions": sum(self._evicted_action_counts.values()),
+            "counts": dict(self._evicted_action_counts),
+        }
+    
+    def _intern_image_bytes(self, image_bytes: bytes) -> bytes:
+        """Return the shared bytes object for a history JPEG, registering it if new."""
+        key = hashlib.blake2b(image_bytes, digest_size=16).digest()
+        entry = self._image_bytes_cache.get(key)
+        if entry is None:
+            entry = self._image_bytes_cache[key] = [image_bytes, 0]
+        entry[1] += 1
+        return entry[0]
+    
+    def _release_image_bytes(self, content) -> None:
+        """Drop the image references held by a message that left the history."""
+        for part in content.parts or ():
+            blob = part.inline_data
+            if blob is None or not blob.data:
+                continue
+            key = hashlib.blake2b(blob.data, digest_size=16).digest()
+            entry = self._image_bytes_cache.get(key)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._image_bytes_cache[key]
+    
     def _parse_function_call_from_text(self, text: str) -> tuple[Optional[str], Dict[str, Any]]:
         """
         Parse function call from text when Gemini describes it instead of using function calling.
@@ -938,8 +2279,6 @@ class GeminiPolicy:
         Returns:
             (action_name, params_dict) or (None, {}) if not found
         """
-        import re
-        
         if not text:
             return (None, {})
         
@@ -2,17 +2,11 @@
 System prompts and templates for Gemini Robotics-ER integration.
 """
 
-from typing import Dict, Any
+import json
+from dataclasses import dataclass, field, fields
+from typing import Dict, Any, Optional, Union
 
-
-def get_system_prompt(task_description: str = None) -> str:
-    """
-    Get system prompt for Gemini 3 Flash.
-    
-    Args:
-        task_description: Optional task description to include in prompt
-    """
-    base_prompt = """You are a high-level robot controller for a MasterPi robot with:
+_BASE_PROMPT = """You are a high-level robot controller for a MasterPi robot with:
 - Eye-in-hand camera (mounted on end-effector)
 - Mecanum wheel holonomic base
 - 6-DOF robotic arm with IK control
@@ -94,178 +88,360 @@ Your response should include:
 Only the tool call will be executed by the robot. Your thinking process is for debugging and understanding your decision-making.
 
 Your goal is to execute the given task by making small, safe, observable steps."""
+
+
+def get_system_prompt() -> str:
+    """
+    Get system prompt for Gemini 3 Flash.
     
-    if task_description:
-        return f"{base_prompt}\n\nCurrent task: {task_description}"
-    return base_prompt
+    Byte-identical for every task so it can be served from a prompt/context
+    cache; the task itself is sent as the first user turn (see get_task_message).
+    """
+    return _BASE_PROMPT
+
+
+def get_task_message(task_description: str) -> str:
+    """
+    Get the task message sent as the first user turn.
+    
+    Args:
+        task_description: Task description (e.g. "pick up red block")
+    """
+    return f"Current task: {task_description}"
 
 
-def format_state_summary(state: Dict[str, Any]) -> str:
+@dataclass(slots=True)
+class StateSummary:
+    """
+    Per-iteration state passed to the policy (built once per iteration by the executor).
+    
+    get() mirrors dict.get so code written against the old dict summaries keeps working.
+    """
+    task: Optional[str] = "unknown"
+    phase: str = "unknown"
+    iteration: int = 0
+    detection: Dict[str, Any] = field(default_factory=dict)
+    last_action: Optional[str] = None
+    last_action_success: Optional[bool] = None
+    # Referee hints
+    oscillation_hint: Optional[str] = None
+    arm_clamping_hint: Optional[str] = None
+    repeated_grasp_hint: Optional[str] = None
+    prolonged_search_hint: Optional[str] = None
+    post_grasp_check_needed: bool = False
+    # The image is the previous turn's frame (the last action did not move anything)
+    reused_frame: bool = False
+    # Typical age of the image when the chosen action starts (None: not reported)
+    latency_ms: Optional[int] = None
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict (for JSON logs)."""
+        return {name: getattr(self, name) for name in _STATE_SUMMARY_FIELDS}
+    
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "StateSummary":
+        """Build from a dict summary (e.g. loaded from session logs); unknown keys are ignored."""
+        return cls(**{key: value for key, value in state.items() if key in _STATE_SUMMARY_FIELDS})
+
+
+_STATE_SUMMARY_FIELDS = frozenset(f.name for f in fields(StateSummary))
+
+
+# Fixed head of format_state_summary (one format_map call per iteration)
+_STATE_TEMPLATE_FOUND = (
+    "Task: {task}\nPhase: {phase}\nIteration: {iteration}\n"
+    "Note: Local detection found something (center={center}, area_ratio={area_ratio:.4f}), "
+    "but you should rely on your own visual analysis of the image."
+)
+_STATE_TEMPLATE_NOTFOUND = (
+    "Task: {task}\nPhase: {phase}\nIteration: {iteration}\n"
+    "Note: No local detection - use your visual understanding to find targets in the image."
+)
+
+
+def format_state_summary(state: Union[StateSummary, Dict[str, Any]]) -> str:
     """
     Format state summary for LLM input.
     
     Args:
-        state: State summary dict
+        state: State summary (a plain dict, e.g. from session logs, is converted)
     
     Returns:
         Formatted string
     """
-    lines = [
-        f"Task: {state.get('task', 'unknown')}",
-        f"Phase: {state.get('phase', 'unknown')}",
-        f"Iteration: {state.get('iteration', 0)}",
-    ]
+    if not isinstance(state, StateSummary):
+        state = StateSummary.from_dict(state)
+    detection = state.detection
+    last_action = state.last_action
+    last_success = state.last_action_success
     
-    detection = state.get('detection', {})
     # Note: Detection results are not reliable - use visual understanding from image
-    if detection.get('found'):
-        lines.append(f"Note: Local detection found something (center={detection.get('center')}, "
-                    f"area_ratio={detection.get('area_ratio', 0):.4f}), "
-                    f"but you should rely on your own visual analysis of the image.")
-    else:
-        lines.append("Note: No local detection - use your visual understanding to find targets in the image.")
+    found = detection.get('found')
+    head = (_STATE_TEMPLATE_FOUND if found else _STATE_TEMPLATE_NOTFOUND).format_map({
+        "task": state.task,
+        "phase": state.phase,
+        "iteration": state.iteration,
+        "center": detection.get('center') if found else None,
+        "area_ratio": detection.get('area_ratio', 0) if found else 0,
+    })
     
-    last_action = state.get('last_action')
-    if last_action:
-        lines.append(f"Last action: {last_action}")
+    # Empty/None entries are skipped
+    return "\n".join(filter(None, (
+        head,
+        last_action and f"Last action: {last_action}",
+        None if last_success is None else f"Last action success: {last_success}",
+        state.reused_frame and ("Note: The image is the same frame as in the previous turn (the last action "
+                                "did not move the robot), so expect no visible change."),
+        state.latency_ms and (f"System latency: the image is about {state.latency_ms} ms old when your action "
+                              "starts executing; anything moving in the image will have moved on by then."),
+        # Referee hints
+        state.oscillation_hint,
+        state.arm_clamping_hint,
+        state.repeated_grasp_hint,
+        state.prolonged_search_hint,
+        state.post_grasp_check_needed and
+        "⚠️ REFEREE HINT: Post-grasp visual check needed. Move arm to bring gripper into view and confirm grasp.",
+    )))
+
+
+def format_history(summary_stats: Dict[str, Any]) -> str:
+    """
+    Format a one-line summary of older actions that no longer fit in the history window.
     
-    last_success = state.get('last_action_success')
-    if last_success is not None:
-        lines.append(f"Last action success: {last_success}")
+    Args:
+        summary_stats: {"actions": total count, "counts": {category: count}}
+    
+    Returns:
+        Formatted string (empty if nothing was summarized)
+    """
+    total = summary_stats.get("actions", 0)
+    if not total:
+        return ""
+    counts = summary_stats.get("counts", {})
+    breakdown = ", ".join(f"{count} {category}" for category, count in
+                          sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+    return f"Earlier ({total} older actions not shown): {breakdown}"
+
+
+# Single-valued "Key: value" lines of format_state_summary, compared by key in format_state_delta
+_STATE_DELTA_KEYS = ("Task", "Phase", "Iteration", "Note", "Last action", "Last action success",
+                     "Last action result")
+
+
+def format_state_delta(state_text: str, previous_state_text: str) -> str:
+    """
+    Format only what changed between two format_state_summary() outputs.
     
-    # Add referee hints
-    oscillation_hint = state.get('oscillation_hint')
-    if oscillation_hint:
-        lines.append(oscillation_hint)
+    Single-valued fields are shown with their previous value; hint lines are
+    reported as new or no longer applying.
     
-    arm_clamping_hint = state.get('arm_clamping_hint')
-    if arm_clamping_hint:
-        lines.append(arm_clamping_hint)
+    Args:
+        state_text: Current formatted state
+        previous_state_text: Formatted state sent on the previous turn
     
-    repeated_grasp_hint = state.get('repeated_grasp_hint')
-    if repeated_grasp_hint:
-        lines.append(repeated_grasp_hint)
+    Returns:
+        Formatted string
+    """
+    def split(text):
+        fields, others = {}, []
+        for line in text.split("\n"):
+            key, sep, value = line.partition(": ")
+            if sep and key in _STATE_DELTA_KEYS:
+                fields[key] = value
+            else:
+                others.append(line)
+        return fields, others
     
-    prolonged_search_hint = state.get('prolonged_search_hint')
-    if prolonged_search_hint:
-        lines.append(prolonged_search_hint)
+    fields, others = split(state_text)
+    previous_fields, previous_others = split(previous_state_text)
     
-    if state.get('post_grasp_check_needed'):
-        lines.append("⚠️ REFEREE HINT: Post-grasp visual check needed. Move arm to bring gripper into view and confirm grasp.")
+    lines = []
+    for key, value in fields.items():
+        previous_value = previous_fields.get(key)
+        if previous_value is None:
+            lines.append(f"{key}: {value}")
+        elif value != previous_value:
+            if key == "Note":
+                lines.append(f"{key}: {value}")
+            else:
+                lines.append(f"{key}: {value} (was {previous_value})")
+    for key in previous_fields:
+        if key not in fields:
+            lines.append(f"{key}: (no longer set)")
+    for line in others:
+        if line not in previous_others:
+            lines.append(f"New: {line}")
+    for line in previous_others:
+        if line not in others:
+            lines.append(f"No longer applies: {line}")
     
-    return "\n".join(lines)
-
-
-def get_tool_descriptions() -> list:
-    """Get tool descriptions for Gemini function calling."""
-    return [
-        {
-            "name": "base_step",
-            "description": "Move base for a short duration (0.2-0.5s), then automatically stop. IMPORTANT: Choose duration based on situation - use shorter durations (0.2-0.3s) for fine adjustments when target is close/centered, longer durations (0.4-0.5s) for searching or initial approach. Always rely on camera feedback after each step.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "velocity": {
-                        "type": "number",
-                        "description": "Velocity in mm/s (0-200)",
-                        "minimum": 0,
-                        "maximum": 200
-                    },
-                    "direction": {
-                        "type": "number",
-                        "description": "Direction angle in degrees (0-360), 0=forward, 90=right, 180=backward, 270=left. CRITICAL: If you've been strafing in the same direction (e.g., direction=90) multiple times without the target moving toward center, try the opposite direction (270) or switch to arm movement.",
-                        "minimum": 0,
-                        "maximum": 360
-                    },
-                    "angular_rate": {
-                        "type": "number",
-                        "description": "Angular velocity in deg/s (-50 to 50), positive=CCW. CRITICAL: If you've been alternating between positive and negative values (oscillating), reduce the magnitude (e.g., use 5 instead of 10) for finer control. For fine centering adjustments, use small values (5-10 deg/s) with short duration (0.2s).",
-                        "minimum": -50,
-                        "maximum": 50
-                    },
-                    "duration": {
-                        "type": "number",
-                        "description": "Movement duration in seconds (0.2-0.5). CRITICAL: Choose duration based on precision needed: 0.2-0.3s for fine adjustments (target close/centered, small corrections), 0.4-0.5s for larger movements (searching, initial approach). Smaller duration = more precise control, prevents overshooting.",
-                        "minimum": 0.2,
-                        "maximum": 0.5
-                    }
+    if not lines:
+        return "Δ No state changes since the previous turn."
+    return "Δ State update (fields not listed are unchanged from the previous turn):\n" + "\n".join(lines)
+
+
+# Tool schemas, built once at import. Shared by all callers - do not mutate.
+_TOOL_DESCRIPTIONS = [
+    {
+        "name": "base_step",
+        "description": "Move base for a short duration (0.2-0.5s), then automatically stop. IMPORTANT: Choose duration based on situation - use shorter durations (0.2-0.3s) for fine adjustments when target is close/centered, longer durations (0.4-0.5s) for searching or initial approach. Always rely on camera feedback after each step.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "velocity": {
+                    "type": "number",
+                    "description": "Velocity in mm/s (0-200)",
+                    "minimum": 0,
+                    "maximum": 200
                 },
-                "required": ["velocity", "direction", "angular_rate", "duration"]
-            }
-        },
-        {
-            "name": "arm_move_xyz",
-            "description": "Move end effector to target XYZ using IK. Returns reachability. Use small increments for visual servoing. CRITICAL: Workspace limits are X=[-10, 10] cm, Y=[5, 15] cm, Z=[0, 25] cm. Coordinates outside these limits will be clamped. If you repeatedly request out-of-range coordinates, the referee will warn you - use base movement to reposition the robot instead.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "x": {
-                        "type": "number",
-                        "description": "X coordinate in cm (-10 to 10)",
-                        "minimum": -10,
-                        "maximum": 10
-                    },
-                    "y": {
-                        "type": "number",
-                        "description": "Y coordinate in cm (5 to 15)",
-                        "minimum": 5,
-                        "maximum": 15
-                    },
-                    "z": {
-                        "type": "number",
-                        "description": "Z coordinate in cm (0 to 25)",
-                        "minimum": 0,
-                        "maximum": 25
-                    },
-                    "pitch": {
-                        "type": "number",
-                        "description": "Pitch angle in degrees (default: 0)",
-                        "default": 0
-                    },
-                    "roll": {
-                        "type": "number",
-                        "description": "Roll angle in degrees (default: -90)",
-                        "default": -90
-                    },
-                    "yaw": {
-                        "type": "number",
-                        "description": "Yaw angle in degrees (default: 90)",
-                        "default": 90
-                    },
-                    "speed": {
-                        "type": "integer",
-                        "description": "Movement speed in ms (500-3000, default: 1500)",
-                        "minimum": 500,
-                        "maximum": 3000,
-                        "default": 1500
-                    }
+                "direction": {
+                    "type": "number",
+                    "description": "Direction angle in degrees (0-360), 0=forward, 90=right, 180=backward, 270=left. CRITICAL: If you've been strafing in the same direction (e.g., direction=90) multiple times without the target moving toward center, try the opposite direction (270) or switch to arm movement.",
+                    "minimum": 0,
+                    "maximum": 360
                 },
-                "required": ["x", "y", "z"]
-            }
-        },
-        {
-            "name": "arm_to_safe_pose",
-            "description": "Move arm to safe pre-grasp position (above workspace).",
-            "parameters": {
-                "type": "object",
-                "properties": {}
-            }
-        },
-        {
-            "name": "gripper_open",
-            "description": "Open gripper.",
-            "parameters": {
-                "type": "object",
-                "properties": {}
+                "angular_rate": {
+                    "type": "number",
+                    "description": "Angular velocity in deg/s (-50 to 50), positive=CCW. CRITICAL: If you've been alternating between positive and negative values (oscillating), reduce the magnitude (e.g., use 5 instead of 10) for finer control. For fine centering adjustments, use small values (5-10 deg/s) with short duration (0.2s).",
+                    "minimum": -50,
+                    "maximum": 50
+                },
+                "duration": {
+                    "type": "number",
+                    "description": "Movement duration in seconds (0.2-0.5). CRITICAL: Choose duration based on precision needed: 0.2-0.3s for fine adjustments (target close/centered, small corrections), 0.4-0.5s for larger movements (searching, initial approach). Smaller duration = more precise control, prevents overshooting.",
+                    "minimum": 0.2,
+                    "maximum": 0.5
+                }
+            },
+            "required": ["velocity", "direction", "angular_rate", "duration"]
+        }
+    },
+    {
+        "name": "arm_move_xyz",
+        "description": "Move end effector to target XYZ using IK. Returns reachability. Use small increments for visual servoing. CRITICAL: Workspace limits are X=[-10, 10] cm, Y=[5, 15] cm, Z=[0, 25] cm. Coordinates outside these limits will be clamped. If you repeatedly request out-of-range coordinates, the referee will warn you - use base movement to reposition the robot instead.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "x": {
+                    "type": "number",
+                    "description": "X coordinate in cm (-10 to 10)",
+                    "minimum": -10,
+                    "maximum": 10
+                },
+                "y": {
+                    "type": "number",
+                    "description": "Y coordinate in cm (5 to 15)",
+                    "minimum": 5,
+                    "maximum": 15
+                },
+                "z": {
+                    "type": "number",
+                    "description": "Z coordinate in cm (0 to 25)",
+                    "minimum": 0,
+                    "maximum": 25
+                },
+                "pitch": {
+                    "type": "number",
+                    "description": "Pitch angle in degrees (default: 0)",
+                    "default": 0
+                },
+                "roll": {
+                    "type": "number",
+                    "description": "Roll angle in degrees (default: -90)",
+                    "default": -90
+                },
+                "yaw": {
+                    "type": "number",
+                    "description": "Yaw angle in degrees (default: 90)",
+                    "default": 90
+                },
+                "speed": {
+                    "type": "integer",
+                    "description": "Movement speed in ms (500-3000, default: 1500)",
+                    "minimum": 500,
+                    "maximum": 3000,
+                    "default": 1500
+                }
+            },
+            "required": ["x", "y", "z"]
+        }
+    },
+    {
+        "name": "arm_to_safe_pose",
+        "description": "Move arm to safe pre-grasp position (above workspace).",
+        "parameters": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "gripper_open",
+        "description": "Open gripper.",
+        "parameters": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "gripper_close",
+        "description": "Close gripper.",
+        "parameters": {
+            "type": "object",
+            "properties": {}
+        }
+    }
+]
+
+
+# Optional tool: the planner reports task completion itself (replaces the separate
+# completion-check request, see GeminiPolicy.enable_completion_tool)
+_TASK_COMPLETE_TOOL = {
+    "name": "task_complete",
+    "description": "Declare the task complete. Call this INSTEAD of a movement action, and ONLY when the current image clearly shows the task is done (see rule 9); if uncertain, keep working.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "confidence": {
+                "type": "number",
+                "description": "Confidence that the task is complete (0.0-1.0)",
+                "minimum": 0,
+                "maximum": 1
+            },
+            "reason": {
+                "type": "string",
+                "description": "Brief explanation"
+            },
+            "evidence": {
+                "type": "string",
+                "description": "What you see in the image that shows the task is complete"
             }
         },
-        {
-            "name": "gripper_close",
-            "description": "Close gripper.",
-            "parameters": {
-                "type": "object",
-                "properties": {}
-            }
-        }
-    ]
+        "required": ["confidence", "reason", "evidence"]
+    }
+}
+_TOOL_DESCRIPTIONS_WITH_COMPLETE = _TOOL_DESCRIPTIONS + [_TASK_COMPLETE_TOOL]
+
+# Canonical compact JSON of the tool schema, serialized once (byte-stable for logs/cache keys)
+_TOOLS_JSON_BYTES = json.dumps(_TOOL_DESCRIPTIONS, separators=(",", ":"), sort_keys=True).encode("utf-8")
+_TOOLS_WITH_COMPLETE_JSON_BYTES = json.dumps(_TOOL_DESCRIPTIONS_WITH_COMPLETE, separators=(",", ":"),
+                                             sort_keys=True).encode("utf-8")
+
+
+def get_tool_descriptions(include_task_complete: bool = False) -> list:
+    """
+    Get tool descriptions for Gemini function calling.
+    
+    Returns the shared module-level list; callers must not mutate it.
+    
+    Args:
+        include_task_complete: Also offer the task_complete tool
+    """
+    return _TOOL_DESCRIPTIONS_WITH_COMPLETE if include_task_complete else _TOOL_DESCRIPTIONS
+
 
+def get_tool_descriptions_json_bytes(include_task_complete: bool = False) -> bytes:
+    """Get the tool descriptions as canonical compact JSON bytes (shared, serialized once)."""
+    return _TOOLS_WITH_COMPLETE_JSON_BYTES if include_task_complete else _TOOLS_JSON_BYTES
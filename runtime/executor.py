@@ -6,7 +6,21 @@ Enforces single skill call per iteration, parameter validation, and safety.
 
 import time
 import os
+import atexit
+import concurrent.futures
+import hashlib
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from typing import Dict, Any, Optional
+import cv2
+import numpy as np
 import yaml
 from dotenv import load_dotenv
 
@@ -15,11 +29,133 @@ from masterpi_rpc.skills import RobotSkills
 from perception.camera import Camera
 from perception.task_detector import TaskDetector
 from planner.gemini_policy import GeminiPolicy
+from planner.prompts import StateSummary
 from runtime.logger import Logger
 
 # Load environment variables
 load_dotenv()
 
+# Per-iteration trace (iteration header, detection, action, thinking). Printed to stdout
+# like the rest of the executor output by default; --quiet raises the level to WARNING
+# so the lines are not even formatted.
+iteration_logger = logging.getLogger("executor")
+iteration_logger.setLevel(logging.INFO)
+if not iteration_logger.handlers:
+    _iteration_handler = logging.StreamHandler(sys.stdout)
+    _iteration_handler.setFormatter(logging.Formatter("%(message)s"))
+    iteration_logger.addHandler(_iteration_handler)
+    iteration_logger.propagate = False
+_iteration_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def enable_async_console():
+    """
+    Write the per-iteration trace from a background thread (QueueHandler -> QueueListener).
+    
+    The control loop then only enqueues records, so a slow terminal (e.g. SSH over WiFi)
+    cannot stall it on multi-KB thinking traces. Trace lines may appear slightly after
+    plain print() output. Idempotent.
+    """
+    global _iteration_listener
+    if _iteration_listener is not None:
+        return
+    records = queue.SimpleQueue()
+    _iteration_listener = logging.handlers.QueueListener(records, *iteration_logger.handlers)
+    for handler in list(iteration_logger.handlers):
+        iteration_logger.removeHandler(handler)
+    iteration_logger.addHandler(logging.handlers.QueueHandler(records))
+    _iteration_listener.start()
+    # Write out whatever is still queued at exit
+    atexit.register(_iteration_listener.stop)
+
+# libyaml-backed loader when PyYAML was built with it
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@lru_cache(maxsize=8)
+def _load_thresholds(path: str, mtime: float) -> Dict[str, Any]:
+    """
+    Parse the thresholds section of a config file (cached per path and mtime).
+    
+    The returned dict is shared between callers and must not be modified.
+    """
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=_YamlLoader)['thresholds']
+
+
+@dataclass(frozen=True, slots=True)
+class GeneralThresholds:
+    """The thresholds.general section, parsed once (values are read every iteration)."""
+    observation_delay_s: float = 0.2
+    target_cycle_s: float = 0.0
+    max_iterations: int = 500
+    completion_skip_hamming: int = 0
+    completion_cache_size: int = 0
+    frame_reuse_max_age_s: float = 0.0
+    
+    @classmethod
+    def from_dict(cls, general: Dict[str, Any]) -> "GeneralThresholds":
+        """Build from the YAML section; missing keys keep their defaults, unknown keys are ignored."""
+        return cls(**{key: value for key, value in general.items() if key in _GENERAL_THRESHOLD_FIELDS})
+
+
+_GENERAL_THRESHOLD_FIELDS = frozenset(f.name for f in fields(GeneralThresholds))
+
+
+# One letter per action for the grasp-sequence regex ("-" = any other action).
+# A grasp attempt: gripper_open → (arm_move_xyz)* → gripper_close → (arm_move_xyz)* → arm_to_safe_pose
+_GRASP_ACTION_CHARS = {
+    "arm_move_xyz": "M",
+    "gripper_open": "O",
+    "gripper_close": "C",
+    "arm_to_safe_pose": "S",
+}
+_GRASP_ATTEMPT_RE = re.compile(r"OM*CM*S")
+# Words in a base_stop's "why" suggesting Gemini considers the task done
+_COMPLETION_WORDS_RE = re.compile(r"complete|successfully|finished|accomplished|task", re.IGNORECASE)
+# Positional (param name, default) specs of the skills called by the act handlers
+_BASE_STEP_ARGS = (("velocity", 0.0), ("direction", 0.0), ("angular_rate", 0.0), ("duration", 0.3))
+_ARM_MOVE_XYZ_ARGS = (("x", 0.0), ("y", 6.0), ("z", 18.0), ("pitch", 0.0), ("roll", -90.0),
+                      ("yaw", 90.0), ("speed", 1500))
+
+# Detection dicts returned by Executor.observe(); Gemini does its own vision,
+# so no local detector runs
+_NO_DETECTION = {
+    "found": False,  # Unknown - let Gemini decide
+    "bbox": None,
+    "center": None,
+    "area_ratio": 0.0,
+    "confidence": 0.0,
+    "note": "No local detection - using Gemini visual understanding"
+}
+_CAPTURE_FAILED_DETECTION = {
+    "found": False,
+    "bbox": None,
+    "center": None,
+    "area_ratio": 0.0,
+    "confidence": 0.0,
+    "error": "Failed to capture frame"
+}
+
+
+def _dhash(image: np.ndarray) -> int:
+    """
+    64-bit difference hash of a frame (9x8 grayscale downscale, horizontal gradients).
+    
+    Near-identical frames have hashes a few bits apart; compare with (a ^ b).bit_count().
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _image_key(image: np.ndarray) -> str:
+    """SHA-1 of a 64x48 grayscale downscale quantized to 16 levels (equal for repeated views)."""
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (64, 48), interpolation=cv2.INTER_AREA) >> 4
+    return hashlib.sha1(small.tobytes()).hexdigest()
+
 
 class Executor:
     """Main execution loop for robot control."""
@@ -28,7 +164,14 @@ class Executor:
                  robot_ip: str = None,
                  rpc_port: int = None,
                  camera_port: int = None,
-                 thresholds_path: str = "config/thresholds.yaml"):
+                 thresholds_path: str = "config/thresholds.yaml",
+                 pipeline_observation: bool = False,
+                 overlap_completion_check: bool = False,
+                 camera_reader: bool = False,
+                 action_chunk: int = 1,
+                 planner_completion: bool = False,
+                 latency_hint: bool = False,
+                 per_iteration_json: bool = False):
         """
         Initialize executor.
         
@@ -37,6 +180,25 @@ class Executor:
             rpc_port: RPC server port (default: from .env RPC_PORT)
             camera_port: Camera stream port (default: from .env CAMERA_PORT)
             thresholds_path: Path to thresholds config
+            pipeline_observation: Capture the next frame on a background thread while
+                                  the current iteration is logged (see _observer_loop)
+            overlap_completion_check: Run the task completion check concurrently with
+                                      planning instead of before it (if the check
+                                      finishes first and the task is done, the plan
+                                      request is cancelled; otherwise it is wasted)
+            camera_reader: Keep the camera stream open on a background reader thread
+                           instead of reconnecting for every frame
+            action_chunk: Let Gemini return up to this many actions per plan; the extra
+                          actions run on the following iterations without planning
+                          requests until an action fails (the queue is also dropped
+                          when a post-grasp check is forced)
+            planner_completion: Let the planner declare completion with a task_complete
+                                tool call instead of running a separate completion-check
+                                request every iteration
+            latency_hint: Measure the image-to-action latency (calibrated at the start of
+                          each run, then tracked per iteration) and tell Gemini about it
+            per_iteration_json: Also log each iteration to its own indented json/iter_XXXXX.json
+                                (events.jsonl always has every iteration)
         """
         # Get defaults from environment variables
         if robot_ip is None:
@@ -51,19 +213,88 @@ class Executor:
         # Initialize components
         self.rpc_client = RPCClient(robot_ip, rpc_port)
         self.skills = RobotSkills(self.rpc_client)
-        self.camera = Camera(robot_ip, camera_port)
-        # Task completion detector (uses gemini-3-flash-preview)
-        self.task_detector = TaskDetector()
+        self.camera = Camera(robot_ip, camera_port, background_reader=camera_reader)
         
         # Load thresholds
-        with open(thresholds_path, 'r') as f:
-            self.thresholds = yaml.safe_load(f)['thresholds']
+        self.thresholds = _load_thresholds(thresholds_path, os.path.getmtime(thresholds_path))
+        # Thresholds used every iteration: parsed once, copied to plain attributes
+        self.general_thresholds = GeneralThresholds.from_dict(self.thresholds['general'])
+        self._observation_delay_s = self.general_thresholds.observation_delay_s
+        self._target_cycle_s = self.general_thresholds.target_cycle_s
+        # Skip the completion check when the frame's dHash is within this many bits
+        # of the last checked frame (0 = always check)
+        self._completion_skip_hamming = self.general_thresholds.completion_skip_hamming
+        # Completion results kept per session, keyed by _image_key (0 = no cache)
+        self._completion_cache_size = self.general_thresholds.completion_cache_size
+        # After base_stop, observe() reuses a frame younger than this instead of capturing
+        self._frame_reuse_max_age_s = self.general_thresholds.frame_reuse_max_age_s
         
         # Initialize Gemini policy
-        self.policy = GeminiPolicy(thresholds_path)
+        self.policy = GeminiPolicy(thresholds_path, thresholds=self.thresholds)
+        # Task completion detector (uses gemini-3-flash-preview); shares the policy's
+        # GenAI client, so both reuse one keep-alive connection pool
+        self.task_detector = TaskDetector(client=self.policy.client)
+        self.planner_completion = planner_completion
+        if planner_completion:
+            self.policy.enable_completion_tool()
+        self.policy.max_action_chunk = action_chunk
+        
+        # Action name -> handler(params), used by act() (one dict lookup per action)
+        self._action_handlers = {
+            "base_step": self._act_base_step,
+            "base_stop": lambda params: self.skills.base_stop(),
+            "task_complete": self._act_task_complete,
+            "arm_move_xyz": self._act_arm_move_xyz,
+            "arm_to_safe_pose": self._act_arm_to_safe_pose,
+            "gripper_open": self._act_gripper_open,
+            "gripper_close": self._act_gripper_close,
+        }
+        
+        # Phase label accessor, bound once (FSM phases are Enums, Gemini's is a plain string)
+        if hasattr(self.policy.phase, "value"):
+            self._get_phase = lambda: self.policy.phase.value
+        else:
+            self._get_phase = lambda: self.policy.phase
         
         # Logger
-        self.logger = Logger()
+        self.logger = Logger(per_iteration_json=per_iteration_json)
+        
+        # Pipelined observation: the observer thread takes capture times (monotonic)
+        # from _obs_requests and puts observe() results into _obs_queue
+        self.pipeline_observation = pipeline_observation
+        self._obs_requests: queue.Queue = queue.Queue(maxsize=1)
+        self._obs_queue: queue.Queue = queue.Queue(maxsize=1)
+        self._observer_thread: Optional[threading.Thread] = None
+        self._observation_pending = False
+        
+        # Completion check overlapped with plan() (one worker: checks never run concurrently)
+        self.overlap_completion_check = overlap_completion_check
+        self._completion_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="completion-check")
+        # dHash of the last frame sent to the task detector and its result
+        # (only touched by whichever thread runs _check_completion, one at a time)
+        self._last_detector_hash: Optional[int] = None
+        self._last_completion_check: Optional[Dict[str, Any]] = None
+        # LRU of completion results for views seen earlier in the session (_image_key -> result)
+        self.vision_cache: OrderedDict = OrderedDict()
+        
+        # Rest of the last action chunk; dropped when an action fails. (Gemini's phase
+        # is a constant label, so it cannot signal that the chunk went stale.)
+        self._pending_actions: deque = deque()
+        
+        # Runs the start-of-task arm reset while run() sets up the session
+        self._setup_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="run-setup")
+        
+        # Image-to-action latency: capture time (time.time()) of the last observed frame,
+        # recent samples and their median (None until measured)
+        self.latency_hint = latency_hint
+        self._frame_timestamp: Optional[float] = None
+        self._last_frame = None  # Frame of the last successful observe()
+        self._latency_samples: deque = deque(maxlen=20)
+        self._latency_calibrated_only = False  # Samples are still the calibration's (no planning time)
+        self.total_latency_s: Optional[float] = None
+        
+        # (height, width) last passed to policy.set_image_size
+        self._image_size: Optional[tuple] = None
         
         # State tracking
         self.iteration = 0
@@ -72,22 +303,47 @@ class Executor:
         self.current_task = None  # Will be set in run()
         
         # Referee: Track recent base_step actions to detect oscillation and ineffective strafing
-        self.recent_base_steps = []  # List of (angular_rate, velocity, direction) tuples
         self.max_recent_steps = 8  # Track last 8 base_step actions
+        # (angular_rate, velocity, direction) tuples; appending evicts the oldest
+        self.recent_base_steps: deque = deque(maxlen=self.max_recent_steps)
         # Post-grasp visual verification flag
         self.need_post_grasp_check = False
         
         # Referee: Track arm movements to detect clamping (coordinates out of workspace)
-        self.recent_arm_moves = []  # List of (requested_x, requested_y, actual_x, actual_y) tuples
         self.max_recent_arm_moves = 6  # Track last 6 arm movements
+        # (requested_x, requested_y, actual_x, actual_y) tuples; appending evicts the oldest
+        self.recent_arm_moves: deque = deque(maxlen=self.max_recent_arm_moves)
         
         # Referee: Track grasping attempts to detect repeated failed grasps
-        self.recent_grasp_attempts = []  # List of action names in grasping sequence
         self.max_grasp_attempts = 20  # Track last 20 actions to detect patterns
+        # Action names in grasping sequence; appending evicts the oldest
+        self.recent_grasp_attempts: deque = deque(maxlen=self.max_grasp_attempts)
         self.grasp_sequence_pattern = ['arm_move_xyz', 'gripper_open', 'gripper_close', 'arm_to_safe_pose']
         
+        # Referee hints by detector name -> (key, hint), recomputed only after the
+        # history they read changes (see _referee_hint / _invalidate_hints)
+        self._hint_cache: Dict[str, tuple] = {}
+        
         # Referee: Track target visibility to detect prolonged search
         self.target_not_visible_count = 0  # Count consecutive iterations where target is not visible
+        
+        # Warm everything up concurrently in the background, so the first iteration
+        # does not pay the connection/stream start-up costs one after another:
+        # - policy: cache the (static) system prompt and tools server-side and open the
+        #   connection with one tiny request
+        # - robot RPC: open the keep-alive connection
+        # - camera: open the stream and decode a first frame
+        # - completion detector: open its connection
+        # run() waits for these (bounded) before the first iteration; failures are only reported.
+        warm_pool = concurrent.futures.ThreadPoolExecutor(max_workers=3, thread_name_prefix="warmup")
+        self._warm_futures = {
+            "Gemini planner": self.policy.warmup(),
+            "robot RPC": warm_pool.submit(self.rpc_client.warmup),
+            "camera": warm_pool.submit(lambda: self.camera.get_frame()[0]),
+        }
+        if not planner_completion:
+            self._warm_futures["completion detector"] = warm_pool.submit(self.task_detector.warmup)
+        warm_pool.shutdown(wait=False)
     
     def observe(self) -> tuple[bool, Optional[Any], Dict[str, Any]]:
         """
@@ -96,63 +352,304 @@ class Executor:
         Returns:
             (success: bool, image: np.ndarray or None, detection: dict)
         """
+        # Nothing moved since the last frame (base_stop): reuse it while it is recent.
+        # With the background reader, take the newest frame it already has instead
+        # (no wait for the next one; it may still be the previous frame).
+        reuse = (self._frame_reuse_max_age_s > 0 and self._last_frame is not None
+                 and self.last_action is not None and self.last_action.get("action") == "base_stop"
+                 and time.time() - self._frame_timestamp < self._frame_reuse_max_age_s)
+        if reuse and not self.camera.reader_running:
+            detection = dict(_NO_DETECTION)
+            detection["reused_frame"] = True
+            return (True, self._last_frame, detection)
+        
         # Capture frame
-        success, image, timestamp = self.camera.get_frame()
+        success, image, timestamp = self.camera.get_frame(require_new=not reuse)
         if not success or image is None:
-            return (False, None, {
-                "found": False,
-                "bbox": None,
-                "center": None,
-                "area_ratio": 0.0,
-                "confidence": 0.0,
-                "error": "Failed to capture frame"
-            })
+            return (False, None, dict(_CAPTURE_FAILED_DETECTION))
+        reused_frame = reuse and timestamp == self._frame_timestamp
+        self._frame_timestamp = timestamp
+        self._last_frame = image
         
-        # No local detection needed - Gemini will use visual understanding
-        detection = {
-            "found": False,  # Unknown - let Gemini decide
-            "bbox": None,
-            "center": None,
-            "area_ratio": 0.0,
-            "confidence": 0.0,
-            "note": "No local detection - using Gemini visual understanding"
-        }
+        # Tell the policy the frame size once (and again only if the camera resolution changes)
+        image_size = image.shape[:2]
+        if image_size != self._image_size:
+            self._image_size = image_size
+            self.policy.set_image_size(image_size[1], image_size[0])
         
+        # No local detection needed - Gemini will use visual understanding
+        # (copied: run() may annotate the dict, e.g. using_cached_frame)
+        detection = dict(_NO_DETECTION)
+        if reused_frame:
+            detection["reused_frame"] = True
         return (True, image, detection)
     
-    def plan(self, image, detection: Dict[str, Any]) -> Dict[str, Any]:
+    def _check_completion(self, image, task: str, last_action_name: Optional[str],
+                          image_bytes: Optional[bytes] = None) -> Dict[str, Any]:
+        """
+        Ask the task detector whether the task is done, unless the scene has not changed.
+        
+        With completion_skip_hamming > 0, a frame whose dHash is within that many bits of
+        the last frame sent to the detector reuses the last result instead of a new request.
+        With completion_cache_size > 0, a view seen earlier in the session (same _image_key)
+        reuses that view's result.
+        
+        Args:
+            image: Current camera frame
+            task: Task description
+            last_action_name: Last action taken (for context)
+            image_bytes: The frame already JPEG-encoded (optional)
+        
+        Returns:
+            The task detector's result dict
+        """
+        if self._completion_skip_hamming <= 0 and self._completion_cache_size <= 0:
+            return self.task_detector.check_completion(
+                image=image, task_description=task, last_action=last_action_name, image_bytes=image_bytes)
+        
+        frame_hash = None
+        if self._completion_skip_hamming > 0:
+            frame_hash = _dhash(image)
+            if (self._last_detector_hash is not None
+                    and (frame_hash ^ self._last_detector_hash).bit_count() < self._completion_skip_hamming):
+                iteration_logger.info("  (Scene unchanged since last completion check, reusing its result)")
+                return self._last_completion_check
+        
+        image_key = None
+        if self._completion_cache_size > 0:
+            image_key = _image_key(image)
+            cached = self.vision_cache.get(image_key)
+            if cached is not None:
+                self.vision_cache.move_to_end(image_key)
+                iteration_logger.info("  (Same view as an earlier completion check, reusing its result)")
+                return cached
+        
+        completion_check = self.task_detector.check_completion(
+            image=image, task_description=task, last_action=last_action_name, image_bytes=image_bytes)
+        # Detector errors come back as confidence 0.0; don't let one stand in for later frames
+        if completion_check.get("confidence", 0.0) > 0.0:
+            if frame_hash is not None:
+                self._last_detector_hash = frame_hash
+                self._last_completion_check = completion_check
+            if image_key is not None:
+                self.vision_cache[image_key] = completion_check
+                if len(self.vision_cache) > self._completion_cache_size:
+                    self.vision_cache.popitem(last=False)
+        return completion_check
+    
+    def calibrate_latency(self, n: int = 10) -> Optional[float]:
+        """
+        Measure the camera-to-action latency without planning.
+        
+        Runs n times: capture a frame, send a no-op motion command (base_stop) and time
+        from the frame's capture to the command's completion. This is the start value
+        used until run() has its own per-iteration samples (which include planning).
+        
+        Args:
+            n: Number of samples
+        
+        Returns:
+            Median latency in seconds (also stored as total_latency_s), None if no sample
+        """
+        samples = []
+        for _ in range(n):
+            success, _, _ = self.observe()
+            if not success:
+                continue
+            self.skills.base_stop()
+            samples.append(time.time() - self._frame_timestamp)
+        if not samples:
+            print("Warning: Latency calibration failed (no camera frames)")
+            return None
+        self._latency_samples.clear()
+        self._latency_samples.extend(samples)
+        self._latency_calibrated_only = True
+        self.total_latency_s = float(np.median(samples))
+        print(f"  → Camera-to-action latency: {self.total_latency_s * 1000:.0f} ms (median of {len(samples)})")
+        return self.total_latency_s
+    
+    def _await_warmup(self, timeout_s: float = 10.0, names: Optional[tuple] = None):
+        """
+        Wait (at most timeout_s in total) for the __init__ warmups and report failures.
+        
+        Args:
+            timeout_s: Total time to wait
+            names: Only wait for these warmups (default: all remaining)
+        """
+        deadline = time.monotonic() + timeout_s
+        for name in list(self._warm_futures):
+            if names is not None and name not in names:
+                continue
+            future = self._warm_futures.pop(name)
+            try:
+                if not future.result(timeout=max(deadline - time.monotonic(), 0.0)):
+                    print(f"Warning: {name} warmup failed")
+            except concurrent.futures.TimeoutError:
+                print(f"Warning: {name} warmup still running after {timeout_s:.0f}s, continuing")
+            except Exception as e:
+                print(f"Warning: {name} warmup failed: {e}")
+    
+    def _task_completed(self, check) -> bool:
+        """
+        Run a completion check and report the outcome.
+        
+        Args:
+            check: Callable returning the task detector's result dict
+        
+        Returns:
+            True if the task was detected as completed
+        """
+        try:
+            completion_check = check()
+        except Exception as e:
+            # If detection fails, continue with planning
+            print(f"Warning: Task completion check failed: {e}")
+            return False
+        if not completion_check.get("completed", False):
+            return False
+        confidence = completion_check.get("confidence", 0.0)
+        reason = completion_check.get("reason", "")
+        evidence = completion_check.get("evidence", "")
+        print(f"\n✓ Task completed! (confidence: {confidence:.2f})")
+        print(f"  Reason: {reason}")
+        print(f"  Evidence: {evidence}")
+        return True
+    
+    def _observer_loop(self):
+        """
+        Observer thread: capture a frame at each requested time.
+        
+        The frame is still taken after the action has settled (the request time is
+        "action end + observation_delay_s"); what overlaps is the capture and the
+        previous iteration's bookkeeping (state summary, log serialization).
+        """
+        while True:
+            capture_at = self._obs_requests.get()
+            if capture_at is None:
+                return
+            delay = capture_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                observation = self.observe()
+            except Exception as e:
+                observation = (False, None, {
+                    "found": False,
+                    "bbox": None,
+                    "center": None,
+                    "area_ratio": 0.0,
+                    "confidence": 0.0,
+                    "error": f"Observer error: {e}"
+                })
+            self._obs_queue.put(observation)
+    
+    def _request_observation(self, capture_at: float):
+        """Ask the observer thread for a frame captured at (or after) capture_at."""
+        if self._observer_thread is None:
+            self._observer_thread = threading.Thread(target=self._observer_loop, name="executor-observer", daemon=True)
+            self._observer_thread.start()
+        self._obs_requests.put(capture_at)
+        self._observation_pending = True
+    
+    def _next_observation(self) -> tuple[bool, Optional[Any], Dict[str, Any]]:
+        """Return the pipelined observation if one was requested, else observe() now."""
+        if not self._observation_pending:
+            return self.observe()
+        self._observation_pending = False
+        return self._obs_queue.get()
+    
+    def _stop_observer(self):
+        if self._observer_thread is None:
+            return
+        if self._observation_pending:
+            self._obs_queue.get()
+            self._observation_pending = False
+        self._obs_requests.put(None)
+        self._observer_thread.join(timeout=5.0)
+        self._observer_thread = None
+    
+    def close(self):
+        """
+        Release the executor's resources: worker pools, camera, RPC connection
+        and the policy (context cache, event loop). Call once, after the last run().
+        """
+        self._stop_observer()
+        self._completion_pool.shutdown(wait=True)
+        self._setup_pool.shutdown(wait=False)
+        self.camera.close()
+        self.rpc_client.close()
+        # Flush Gemini logs and release the context cache
+        self.policy.close()
+    
+    def build_state_summary(self, detection: Dict[str, Any]) -> StateSummary:
+        """
+        Build this iteration's state summary (sent to the policy, then logged).
+        
+        Args:
+            detection: Current detection result
+        
+        Returns:
+            State summary; last_action/last_action_success describe the previous action
+        """
+        last_result = self.last_action_result
+        return StateSummary(
+            task=self.current_task,
+            phase="unknown",
+            iteration=self.iteration,
+            detection=detection,  # Included for logging, but Gemini ignores it
+            last_action=self.last_action.get("action") if self.last_action else None,
+            last_action_success=last_result.get("success", False) if last_result else None,
+            # Referee hints for Gemini (cached until the history they read changes)
+            oscillation_hint=self._referee_hint("oscillation", self._detect_oscillation),
+            arm_clamping_hint=self._referee_hint("arm_clamping", self._detect_arm_clamping),
+            repeated_grasp_hint=self._referee_hint("repeated_grasp", self._detect_repeated_grasp_attempts),
+            prolonged_search_hint=self._referee_hint("prolonged_search", self._detect_prolonged_search,
+                                                     key=self.iteration >= 10),
+            post_grasp_check_needed=self.need_post_grasp_check,  # Referee hint for Gemini
+            reused_frame=detection.get("reused_frame", False),
+            # Rounded to 50 ms so the prompt does not change with every sample
+            latency_ms=(int(round(self.total_latency_s * 20)) * 50 or None)
+            if self.latency_hint and self.total_latency_s else None
+        )
+    
+    def plan(self, image, detection: Dict[str, Any], state_summary: StateSummary) -> Dict[str, Any]:
         """
         Plan next action.
         
         Args:
             image: Current camera frame (for Gemini policy)
             detection: Current detection result
+            state_summary: This iteration's state summary (see build_state_summary)
         
         Returns:
             Action plan dict with "action", "params", "phase", "why"
         """
-        # Detect oscillation pattern in recent base_step actions
-        oscillation_hint = self._detect_oscillation()
-        arm_clamping_hint = self._detect_arm_clamping()
-        repeated_grasp_hint = self._detect_repeated_grasp_attempts()
-        prolonged_search_hint = self._detect_prolonged_search()
-        
-        # Build state summary for Gemini
-        state_summary = {
-            "task": self.current_task,
-            "phase": "unknown",
-            "iteration": self.iteration,
-            "detection": detection,  # Included for logging, but Gemini ignores it
-            "last_action": self.last_action.get("action") if self.last_action else None,
-            "last_action_success": self.last_action_result is not None and self.last_action_result.get("success", False) if self.last_action_result else None,
-            "oscillation_hint": oscillation_hint,  # Referee hint for Gemini
-            "arm_clamping_hint": arm_clamping_hint,  # Referee hint for Gemini
-            "repeated_grasp_hint": repeated_grasp_hint,  # Referee hint for Gemini
-            "prolonged_search_hint": prolonged_search_hint,  # Referee hint for Gemini
-            "post_grasp_check_needed": self.need_post_grasp_check  # Referee hint for Gemini
-        }
         return self.policy.plan(image, detection, state_summary, self.last_action_result)
     
+    def _referee_hint(self, name: str, detect, key=None) -> Optional[str]:
+        """
+        Return detect()'s hint, reusing the last one while its history is unchanged.
+        
+        Args:
+            name: Cache entry, dropped by _invalidate_hints when the detector's deque changes
+            detect: The _detect_* method
+            key: Any other input the hint depends on (recomputed when it changes)
+        
+        Returns:
+            Hint string or None
+        """
+        cached = self._hint_cache.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        hint = detect()
+        self._hint_cache[name] = (key, hint)
+        return hint
+    
+    def _invalidate_hints(self, *names: str):
+        """Drop the cached referee hints of detectors whose history changed."""
+        for name in names:
+            self._hint_cache.pop(name, None)
+    
     def _detect_arm_clamping(self) -> Optional[str]:
         """
         Detect if arm movements are being clamped to workspace limits repeatedly.
@@ -194,38 +691,54 @@ class Executor:
         if len(self.recent_base_steps) < 6:
             return None
         
-        # Extract data
-        angular_rates = [ar for ar, v, d in self.recent_base_steps]
-        velocities = [v for ar, v, d in self.recent_base_steps]
-        directions = [d for ar, v, d in self.recent_base_steps]
+        # One pass over the history:
+        # rotation_only - velocity ≈ 0 throughout (check 1)
+        # strafing - velocity > 0 and no rotation throughout (check 2)
+        rotation_only = True
+        strafing = True
+        sign_changes = 0
+        # Direction range, also with headings below 180° shifted by 360° so a
+        # cluster around 0°/360° is contiguous
+        dir_min = dir_shifted_min = float("inf")
+        dir_max = dir_shifted_max = float("-inf")
+        prev_ar = 0
+        for ar, v, d in self.recent_base_steps:
+            if abs(v) >= 1e-6:
+                rotation_only = False
+            if abs(v) <= 1e-6 or abs(ar) >= 1e-6:
+                strafing = False
+            if not (rotation_only or strafing):
+                return None
+            if ar != 0 and prev_ar != 0 and (ar > 0) != (prev_ar > 0):
+                sign_changes += 1
+            prev_ar = ar
+            d %= 360.0
+            dir_min = min(dir_min, d)
+            dir_max = max(dir_max, d)
+            if d < 180.0:
+                d += 360.0
+            dir_shifted_min = min(dir_shifted_min, d)
+            dir_shifted_max = max(dir_shifted_max, d)
         
         # Check 1: Rotation oscillation (velocity ≈ 0, angular_rate alternates)
-        rotation_only = all(abs(v) < 1e-6 for v in velocities)
-        if rotation_only:
-            sign_changes = 0
-            for i in range(1, len(angular_rates)):
-                if angular_rates[i] != 0 and angular_rates[i-1] != 0:
-                    if (angular_rates[i] > 0) != (angular_rates[i-1] > 0):
-                        sign_changes += 1
-            
-            if sign_changes >= 4:
-                return ("⚠️ REFEREE HINT: Detected oscillation pattern in recent base_step rotations "
-                       f"(alternating angular_rate: {angular_rates[-6:]}). "
-                       "Consider switching to strafe-based centering (velocity=30-60, direction=90/270, angular_rate=0) "
-                       "or using arm movement if target is close.")
+        if rotation_only and sign_changes >= 4:
+            angular_rates = [ar for ar, v, d in self.recent_base_steps]
+            return ("⚠️ REFEREE HINT: Detected oscillation pattern in recent base_step rotations "
+                   f"(alternating angular_rate: {angular_rates[-6:]}). "
+                   "Consider switching to strafe-based centering (velocity=30-60, direction=90/270, angular_rate=0) "
+                   "or using arm movement if target is close.")
         
         # Check 2: Ineffective same-direction strafing (velocity > 0, same direction, no rotation)
-        strafing = all(abs(v) > 1e-6 and abs(ar) < 1e-6 for ar, v, d in self.recent_base_steps)
-        if strafing and len(self.recent_base_steps) >= 6:
-            # Check if all recent steps are in the same direction (within 10 degrees)
-            if len(set(directions)) <= 2:  # Same or very similar direction
-                return ("⚠️ REFEREE HINT: Detected ineffective strafing pattern - "
-                       f"repeated {len(self.recent_base_steps)} base_step actions in same direction "
-                       f"(direction={directions[-1]:.0f}°, velocity={velocities[-1]:.0f} mm/s) without progress. "
-                       "If target is visible but not centering, try: "
-                       "1) Reverse direction (direction=270 if currently 90, or vice versa), "
-                       "2) Use arm movement to approach target directly, "
-                       "3) Adjust camera height (arm z) for better view.")
+        # Check if all recent steps are in the same direction (within 10 degrees)
+        if strafing and min(dir_max - dir_min, dir_shifted_max - dir_shifted_min) <= 10.0:
+            _, last_velocity, last_direction = self.recent_base_steps[-1]
+            return ("⚠️ REFEREE HINT: Detected ineffective strafing pattern - "
+                   f"repeated {len(self.recent_base_steps)} base_step actions in same direction "
+                   f"(direction={last_direction:.0f}°, velocity={last_velocity:.0f} mm/s) without progress. "
+                   "If target is visible but not centering, try: "
+                   "1) Reverse direction (direction=270 if currently 90, or vice versa), "
+                   "2) Use arm movement to approach target directly, "
+                   "3) Adjust camera height (arm z) for better view.")
         
         return None
     
@@ -239,33 +752,10 @@ class Executor:
         if len(self.recent_grasp_attempts) < 6:
             return None
         
-        # Check for repeated grasp sequences with flexible pattern matching
-        # Pattern: (arm_move_xyz)* → gripper_open → (arm_move_xyz)* → gripper_close → arm_to_safe_pose
-        # This allows multiple arm movements before/after gripper_open
-        
-        pattern_count = 0
-        i = 0
-        while i < len(self.recent_grasp_attempts) - 2:
-            # Look for gripper_open
-            if self.recent_grasp_attempts[i] == 'gripper_open':
-                # After gripper_open, look for gripper_close (allowing arm_move_xyz in between)
-                j = i + 1
-                while j < len(self.recent_grasp_attempts) and self.recent_grasp_attempts[j] == 'arm_move_xyz':
-                    j += 1
-                
-                # Check if we have gripper_close followed by arm_to_safe_pose
-                if (j < len(self.recent_grasp_attempts) and
-                    self.recent_grasp_attempts[j] == 'gripper_close'):
-                    k = j + 1
-                    while k < len(self.recent_grasp_attempts) and self.recent_grasp_attempts[k] == 'arm_move_xyz':
-                        k += 1
-                    
-                    if (k < len(self.recent_grasp_attempts) and
-                        self.recent_grasp_attempts[k] == 'arm_to_safe_pose'):
-                        pattern_count += 1
-                        i = k + 1  # Skip past this pattern
-                        continue
-            i += 1
+        # Count non-overlapping grasp attempts (see _GRASP_ATTEMPT_RE); this allows
+        # multiple arm movements before/after gripper_open
+        sequence = "".join(_GRASP_ACTION_CHARS.get(action, "-") for action in self.recent_grasp_attempts)
+        pattern_count = len(_GRASP_ATTEMPT_RE.findall(sequence))
         
         # If we've seen the pattern 2+ times, it's likely failing
         if pattern_count >= 2:
@@ -316,117 +806,74 @@ class Executor:
         params = action_plan.get("params", {})
         
         # Execute action via skills
-        if action_name == "base_step":
-            velocity = params.get("velocity", 0.0)
-            angular_rate = params.get("angular_rate", 0.0)
-            direction = params.get("direction", 0.0)
-            
-            # Record base_step for oscillation and ineffective strafing detection
-            self.recent_base_steps.append((angular_rate, velocity, direction))
-            if len(self.recent_base_steps) > self.max_recent_steps:
-                self.recent_base_steps.pop(0)
-            
-            return self.skills.base_step(
-                velocity,
-                direction,
-                angular_rate,
-                params.get("duration", 0.3)
-            )
-        elif action_name == "base_stop":
-            return self.skills.base_stop()
-        elif action_name == "task_complete":
-            # Special action: Gemini declared task completion
-            # Return success but don't execute any robot action
-            return (True, {
-                "action": "task_complete",
-                "message": "Task completion declared by Gemini"
-            }, "")
-        elif action_name == "arm_move_xyz":
-            # Clear base_step history when switching to arm movement
-            self.recent_base_steps.clear()
-            
-            # Record requested coordinates before clamping
-            requested_x = params.get("x", 0.0)
-            requested_y = params.get("y", 6.0)
-            
-            # Execute arm movement
-            success, result, error = self.skills.arm_move_xyz(
-                requested_x,
-                requested_y,
-                params.get("z", 18.0),
-                params.get("pitch", 0.0),
-                params.get("roll", -90.0),
-                params.get("yaw", 90.0),
-                params.get("speed", 1500)
-            )
-            
-            # Record arm movement for clamping detection
-            if success and result:
-                actual_x = result.get("x", requested_x)
-                actual_y = result.get("y", requested_y)
-                self.recent_arm_moves.append((requested_x, requested_y, actual_x, actual_y))
-                if len(self.recent_arm_moves) > self.max_recent_arm_moves:
-                    self.recent_arm_moves.pop(0)
-            
-            return success, result, error
-        elif action_name == "arm_to_safe_pose":
-            # Clear base_step history when switching to arm movement
-            self.recent_base_steps.clear()
-            return self.skills.arm_to_safe_pose()
-        elif action_name == "gripper_open":
-            return self.skills.gripper_open()
-        elif action_name == "gripper_close":
-            success, result, error = self.skills.gripper_close()
-            # If gripper close succeeded, schedule a post-grasp visual check
-            if success:
-                self.need_post_grasp_check = True
-            # Record action for grasp pattern detection
-            self.recent_grasp_attempts.append(action_name)
-            if len(self.recent_grasp_attempts) > self.max_grasp_attempts:
-                self.recent_grasp_attempts.pop(0)
-            return success, result, error
-        elif action_name in ["arm_move_xyz", "gripper_open", "arm_to_safe_pose"]:
-            # Record action for grasp pattern detection
-            self.recent_grasp_attempts.append(action_name)
-            if len(self.recent_grasp_attempts) > self.max_grasp_attempts:
-                self.recent_grasp_attempts.pop(0)
-            # Continue with existing logic for these actions
-            if action_name == "arm_move_xyz":
-                # Clear base_step history when switching to arm movement
-                self.recent_base_steps.clear()
-                
-                # Record requested coordinates before clamping
-                requested_x = params.get("x", 0.0)
-                requested_y = params.get("y", 6.0)
-                
-                # Execute arm movement
-                success, result, error = self.skills.arm_move_xyz(
-                    requested_x,
-                    requested_y,
-                    params.get("z", 18.0),
-                    params.get("pitch", 0.0),
-                    params.get("roll", -90.0),
-                    params.get("yaw", 90.0),
-                    params.get("speed", 1500)
-                )
-                
-                # Record arm movement for clamping detection
-                if success and result:
-                    actual_x = result.get("x", requested_x)
-                    actual_y = result.get("y", requested_y)
-                    self.recent_arm_moves.append((requested_x, requested_y, actual_x, actual_y))
-                    if len(self.recent_arm_moves) > self.max_recent_arm_moves:
-                        self.recent_arm_moves.pop(0)
-                
-                return success, result, error
-            elif action_name == "arm_to_safe_pose":
-                # Clear base_step history when switching to arm movement
-                self.recent_base_steps.clear()
-                return self.skills.arm_to_safe_pose()
-            elif action_name == "gripper_open":
-                return self.skills.gripper_open()
-        else:
+        handler = self._action_handlers.get(action_name)
+        if handler is None:
             return (False, {}, f"Unknown action: {action_name}")
+        return handler(params)
+    
+    def _act_base_step(self, params: Dict[str, Any]) -> tuple[bool, Dict[str, Any], str]:
+        args = [params.get(name, default) for name, default in _BASE_STEP_ARGS]
+        velocity, direction, angular_rate = args[0], args[1], args[2]
+        
+        # Record base_step for oscillation and ineffective strafing detection
+        self.recent_base_steps.append((angular_rate, velocity, direction))
+        self._invalidate_hints("oscillation", "prolonged_search")
+        
+        return self.skills.base_step(*args)
+    
+    def _act_task_complete(self, params: Dict[str, Any]) -> tuple[bool, Dict[str, Any], str]:
+        # Special action: Gemini declared task completion
+        # Return success but don't execute any robot action
+        return (True, {
+            "action": "task_complete",
+            "message": "Task completion declared by Gemini"
+        }, "")
+    
+    def _act_arm_move_xyz(self, params: Dict[str, Any]) -> tuple[bool, Dict[str, Any], str]:
+        # Clear base_step history when switching to arm movement
+        self.recent_base_steps.clear()
+        self._invalidate_hints("oscillation", "prolonged_search")
+        self._record_grasp_action("arm_move_xyz")
+        
+        # Record requested coordinates before clamping
+        args = [params.get(name, default) for name, default in _ARM_MOVE_XYZ_ARGS]
+        requested_x, requested_y = args[0], args[1]
+        
+        # Execute arm movement
+        success, result, error = self.skills.arm_move_xyz(*args)
+        
+        # Record arm movement for clamping detection
+        if success and result:
+            actual_x = result.get("x", requested_x)
+            actual_y = result.get("y", requested_y)
+            self.recent_arm_moves.append((requested_x, requested_y, actual_x, actual_y))
+            self._invalidate_hints("arm_clamping")
+        
+        return success, result, error
+    
+    def _act_arm_to_safe_pose(self, params: Dict[str, Any]) -> tuple[bool, Dict[str, Any], str]:
+        # Clear base_step history when switching to arm movement
+        self.recent_base_steps.clear()
+        self._invalidate_hints("oscillation", "prolonged_search")
+        self._record_grasp_action("arm_to_safe_pose")
+        return self.skills.arm_to_safe_pose()
+    
+    def _act_gripper_open(self, params: Dict[str, Any]) -> tuple[bool, Dict[str, Any], str]:
+        self._record_grasp_action("gripper_open")
+        return self.skills.gripper_open()
+    
+    def _act_gripper_close(self, params: Dict[str, Any]) -> tuple[bool, Dict[str, Any], str]:
+        success, result, error = self.skills.gripper_close()
+        # If gripper close succeeded, schedule a post-grasp visual check
+        if success:
+            self.need_post_grasp_check = True
+        self._record_grasp_action("gripper_close")
+        return success, result, error
+    
+    def _record_grasp_action(self, action_name: str):
+        """Record an arm/gripper action for grasp pattern detection."""
+        self.recent_grasp_attempts.append(action_name)
+        self._invalidate_hints("repeated_grasp")
     
     def run(self, task: str, max_iterations: int = 500):
         """
@@ -439,8 +886,24 @@ class Executor:
         print(f"Starting execution: {task}")
         print(f"Policy: {type(self.policy).__name__}")
         
+        # Reset arm to safe pose before starting new task (the motion takes seconds;
+        # the session setup below runs meanwhile)
+        print("Resetting arm to safe pose...")
+        print(f"  → Target position: x=0.0, y=5.0, z=20.0, pitch=0.0, roll=-90.0, yaw=90.0, speed=1500")
+        # The RPC session (one pooled connection) must not be shared with a warmup still in flight
+        self._await_warmup(names=("robot RPC",))
+        arm_reset = self._setup_pool.submit(self.skills.arm_to_safe_pose)
+        
+        self._await_warmup()
+        
         # Store current task
         self.current_task = task
+        # A completion check cached for another run/task must not be reused
+        self._last_detector_hash = None
+        self._last_completion_check = None
+        self.vision_cache.clear()
+        self._pending_actions.clear()
+        self._last_frame = None
         
         # Start logging session
         self.logger.start_session(task)
@@ -453,44 +916,64 @@ class Executor:
         if session_dir:
             self.policy.set_log_dir(session_dir)
         
-        # Reset arm to safe pose before starting new task
-        print("Resetting arm to safe pose...")
-        print(f"  → Target position: x=0.0, y=5.0, z=20.0, pitch=0.0, roll=-90.0, yaw=90.0, speed=1500")
-        success, result, error = self.skills.arm_to_safe_pose()
+        # Wait for the arm reset
+        try:
+            success, result, error = arm_reset.result(timeout=15)
+        except concurrent.futures.TimeoutError:
+            success, result, error = False, None, "no response within 15s"
+        except Exception as e:
+            success, result, error = False, None, str(e)
         if success:
-            print(f"✓ Arm reset command sent successfully")
+            # One write for the whole report
+            lines = ["✓ Arm reset command sent successfully"]
             if result:
                 if "ik_success" in result:
-                    print(f"  → IK calculation: {'success' if result['ik_success'] else 'failed'}")
+                    lines.append(f"  → IK calculation: {'success' if result['ik_success'] else 'failed'}")
                 if "wait_time" in result:
-                    print(f"  → Waited {result['wait_time']:.1f}s for movement to complete")
+                    lines.append(f"  → Waited {result['wait_time']:.1f}s for movement to complete")
                 # Show actual parameters used (after clamping)
                 if "x" in result and "y" in result and "z" in result:
-                    print(f"  → Actual position: x={result['x']}, y={result['y']}, z={result['z']}")
+                    lines.append(f"  → Actual position: x={result['x']}, y={result['y']}, z={result['z']}")
+            print("\n".join(lines))
         else:
             print(f"⚠️  Warning: Arm reset failed: {error}")
             if result:
                 print(f"  → RPC result: {result}")
             # Continue anyway - arm might already be in a safe position
         
+        if self.latency_hint:
+            self.calibrate_latency()
+        
         # Track consecutive base_stop actions (may indicate task completion)
         consecutive_base_stop = 0
         max_consecutive_base_stop = 3  # If 3+ consecutive base_stop with completion keywords, stop
         
+        # Loop pacing (monotonic deadlines): the next observation waits until the action
+        # has settled (observation_delay_s after act) and, if target_cycle_s > 0, until
+        # the cycle is at least that long. Time spent logging counts toward both.
+        # Cycle deadlines are a fixed-rate tick (like ros::Rate): each one is the previous
+        # deadline + target_cycle_s, so wake-up latency does not accumulate; after an
+        # overrun the tick restarts from now instead of trying to catch up.
+        observation_delay_s = self._observation_delay_s
+        target_cycle_s = self._target_cycle_s
+        cycle_deadline = time.monotonic()
+        
         try:
             while self.iteration < max_iterations:
+                cycle_deadline = max(time.monotonic(), cycle_deadline) + target_cycle_s
                 self.iteration += 1
-                print(f"\n--- Iteration {self.iteration} ---")
+                iteration_logger.info("\n--- Iteration %d ---", self.iteration)
                 
                 # Observe
-                obs_success, image, detection = self.observe()
+                obs_success, image, detection = self._next_observation()
                 if not obs_success:
                     error_msg = detection.get("error", "Unknown error")
                     print(f"Warning: Observation failed - {error_msg}")
                     # Use latest cached frame if available
                     if self.camera.latest_frame is not None:
                         print("  → Using cached frame from previous observation")
-                        image = self.camera.latest_frame.copy()
+                        image = self.camera.latest_frame  # Read-only, shared without a copy
+                        self._frame_timestamp = self.camera.latest_timestamp
                         obs_success = True
                         # Update detection to indicate we're using cached frame
                         detection["using_cached_frame"] = True
@@ -508,33 +991,38 @@ class Executor:
                         except Exception as e:
                             print(f"  → Retry exception: {e}, will log without image")
                 
-                # Get phase string
-                phase_str = str(self.policy.phase)
-                print(f"Detection: found={detection.get('found')}, "
-                      f"area_ratio={detection.get('area_ratio', 0):.4f}, "
-                      f"phase={phase_str}")
-                
-                # Check task completion using fast detector (gemini-3-flash-preview)
-                # This happens BEFORE planning to avoid unnecessary planning if task is done
+                # JPEG-encode the frame once: the same bytes go to the completion check,
+                # plan() (a cache hit in the policy) and the iteration log
+                image_bytes = None
                 if image is not None:
                     try:
-                        completion_check = self.task_detector.check_completion(
-                            image=image,
-                            task_description=task,
-                            last_action=self.last_action.get("action") if self.last_action else None
-                        )
-                        
-                        if completion_check.get("completed", False):
-                            confidence = completion_check.get("confidence", 0.0)
-                            reason = completion_check.get("reason", "")
-                            evidence = completion_check.get("evidence", "")
-                            print(f"\n✓ Task completed! (confidence: {confidence:.2f})")
-                            print(f"  Reason: {reason}")
-                            print(f"  Evidence: {evidence}")
-                            break
+                        image_bytes = self.policy.encode_image(image)
                     except Exception as e:
-                        # If detection fails, continue with planning
-                        print(f"Warning: Task completion check failed: {e}")
+                        print(f"Warning: Failed to encode frame: {e}")
+                
+                # Per-iteration values used more than once below
+                phase = self._get_phase()
+                # State summary for the policy; reused (updated after acting) for the log.
+                # Its last_action is also the context for the completion check.
+                state_summary = self.build_state_summary(detection)
+                
+                iteration_logger.info("Detection: found=%s, area_ratio=%.4f, phase=%s",
+                                      detection.get('found'), detection.get('area_ratio', 0), phase)
+                
+                # Check task completion using fast detector (gemini-3-flash-preview)
+                # This happens BEFORE planning to avoid unnecessary planning if task is done,
+                # or (overlap_completion_check) concurrently with planning on a worker thread
+                # Skipped while the post-grasp check pose is forced: the gripper is only
+                # in view after that action, so the next iteration checks instead
+                completion_future = None
+                if image is not None and not self.planner_completion and not self.need_post_grasp_check:
+                    last_action_name = state_summary.last_action
+                    if self.overlap_completion_check:
+                        completion_future = self._completion_pool.submit(
+                            self._check_completion, image, task, last_action_name, image_bytes
+                        )
+                    elif self._task_completed(lambda: self._check_completion(image, task, last_action_name, image_bytes)):
+                        break
                 
                 # If post-grasp visual verification is pending, force a check action
                 if self.need_post_grasp_check:
@@ -546,39 +1034,77 @@ class Executor:
                     }
                     # Clear flag after scheduling the forced action
                     self.need_post_grasp_check = False
+                    self._pending_actions.clear()
+                elif self._pending_actions:
+                    # Next action of the last chunk (no planning request)
+                    action_plan = self._pending_actions.popleft()
+                    iteration_logger.info("Queued action from the last plan (%d more queued)",
+                                          len(self._pending_actions))
                 else:
                     # Plan (using gemini-robotics-er-1.5-preview)
-                    action_plan = self.plan(image, detection)
+                    self._pending_actions.clear()
+                    if completion_future is not None:
+                        # Overlapped: stop waiting for the plan as soon as the check says done
+                        plan_future = self.policy.submit_plan(image, detection, state_summary,
+                                                              self.last_action_result)
+                        concurrent.futures.wait((completion_future, plan_future),
+                                                return_when=concurrent.futures.FIRST_COMPLETED)
+                        if completion_future.done():
+                            task_done = self._task_completed(completion_future.result)
+                            completion_future = None
+                            if task_done:
+                                plan_future.cancel()
+                                break
+                        action_plan = plan_future.result()
+                    else:
+                        action_plan = self.plan(image, detection, state_summary)
+                    if action_plan.get("action_chunk"):
+                        self._pending_actions.extend(action_plan["action_chunk"])
                 
-                # Print action with full thinking process
-                action_name = action_plan.get('action', 'unknown')
-                thinking_process = action_plan.get('thinking_process') or action_plan.get('why', '')
+                # Overlapped completion check: the plan is dropped if the task is already done
+                if completion_future is not None and self._task_completed(completion_future.result):
+                    break
+                action_name = action_plan.get("action")
                 
-                print(f"Action: {action_name}")
-                if thinking_process:
-                    # Print thinking process in a readable format
-                    print(f"Thinking: {thinking_process}")
-                else:
-                    why = action_plan.get('why', '')
-                    if why:
-                        print(f"Why: {why}")
+                # Print action with full thinking process
+                if iteration_logger.isEnabledFor(logging.INFO):
+                    thinking_process = action_plan.get('thinking_process') or action_plan.get('why', '')
+                    # One record (one terminal write) for the action and its thinking process
+                    if thinking_process:
+                        iteration_logger.info("Action: %s\nThinking: %s", action_name or 'unknown',
+                                              thinking_process)
+                    else:
+                        iteration_logger.info("Action: %s", action_name or 'unknown')
                 
-                # Act
+                # Act (latency sample: age of the frame the action was planned from;
+                # only measured when it is reported to the planner)
+                if self.latency_hint and self._frame_timestamp is not None:
+                    if self._latency_calibrated_only:
+                        # Real samples include planning time; the calibration was only a start value
+                        self._latency_samples.clear()
+                        self._latency_calibrated_only = False
+                    self._latency_samples.append(time.time() - self._frame_timestamp)
+                    self.total_latency_s = float(np.median(self._latency_samples))
                 act_success, action_result, error = self.act(action_plan)
+                next_observation_at = max(time.monotonic() + observation_delay_s, cycle_deadline)
                 self.last_action = action_plan
                 self.last_action_result = action_result
                 
                 # Check for task completion
-                if action_plan.get("action") == "task_complete":
+                if action_name == "task_complete":
                     print("\n✓ Task completion declared by Gemini")
-                    print(f"Reason: {action_plan.get('why', 'N/A')[:200]}")
+                    completion = action_plan.get("completion")
+                    if completion:
+                        print(f"  Confidence: {completion['confidence']:.2f}")
+                        print(f"  Reason: {completion['reason']}")
+                        print(f"  Evidence: {completion['evidence']}")
+                    else:
+                        print(f"Reason: {action_plan.get('why', 'N/A')[:200]}")
                     break
                 
                 # Track consecutive base_stop actions (may indicate completion)
-                if action_plan.get("action") == "base_stop":
-                    why = action_plan.get("why", "").lower()
-                    completion_keywords = ["complete", "successfully", "finished", "accomplished", "task"]
-                    if any(kw in why for kw in completion_keywords):
+                if action_name == "base_stop":
+                    if _COMPLETION_WORDS_RE.search(action_plan.get("why", "")):
                         consecutive_base_stop += 1
                         if consecutive_base_stop >= max_consecutive_base_stop:
                             print(f"\n✓ Detected {consecutive_base_stop} consecutive base_stop actions with completion keywords")
@@ -591,6 +1117,8 @@ class Executor:
                 
                 if not act_success:
                     print(f"Action failed: {error}")
+                    # The rest of the chunk assumed this action worked
+                    self._pending_actions.clear()
                     # If it's a connection error, provide additional help
                     if "Cannot connect to robot" in error or "No route to host" in error:
                         print("\n⚠️  Robot connection issue detected!")
@@ -601,28 +1129,31 @@ class Executor:
                         print(f"   4. Network connectivity: try 'ping {self.rpc_client.ip_address}'")
                         print("   The system will continue trying, but actions will fail until connection is restored.")
                 
-                # Create state summary
-                phase_str = str(self.policy.phase)  # Gemini uses string phase
-                state_summary = {
-                    "task": task,
-                    "phase": phase_str,
-                    "iteration": self.iteration,
-                    "detection": detection,
-                    "last_action": action_plan.get("action"),
-                    "last_action_success": act_success
-                }
+                # Pipelined: capture the next frame once the action has settled, in the
+                # background, while this iteration is logged
+                if self.pipeline_observation:
+                    self._request_observation(next_observation_at)
+                
+                # Logged state summary describes this iteration's action
+                state_summary.phase = self._get_phase()
+                state_summary.last_action = action_name
+                state_summary.last_action_success = act_success
                 
                 # Log (includes thinking process from action_plan)
                 self.logger.log_iteration(
                     image=image,
                     detection=detection,
-                    state_summary=state_summary,
+                    state_summary=state_summary.to_dict(),
                     action_plan=action_plan,  # Contains "thinking_process" field
-                    action_result=action_result
+                    action_result=action_result,
+                    image_bytes=image_bytes
                 )
                 
-                # Small delay for observation
-                time.sleep(self.thresholds['general']['observation_delay_s'])
+                # Wait out the rest of the settle delay / cycle time
+                if not self.pipeline_observation:
+                    remaining = next_observation_at - time.monotonic()
+                    if remaining > 0:
+                        time.sleep(remaining)
             
             if self.iteration >= max_iterations:
                 print(f"Reached maximum iterations ({max_iterations})")
@@ -634,9 +1165,11 @@ class Executor:
             import traceback
             traceback.print_exc()
         finally:
-            # Stop all movement
-            self.skills.base_stop()
-            self.camera.close()
+            # Stop all movement (short timeout: an unreachable robot must not hang shutdown)
+            self.skills.base_stop(timeout=2.0)
+            self._stop_observer()
+            # Flush Gemini logs so the session directory is complete
+            self.policy.flush_logs()
             
             # Save log summary
             self.logger.save_summary()
@@ -6,6 +6,8 @@ Logs each iteration with images, detection results, state, and actions.
 
 import json
 import os
+import queue
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
@@ -13,33 +15,68 @@ from typing import Dict, Any, Optional
 import cv2
 import numpy as np
 
+try:
+    import simplejpeg  # Optional: libjpeg-turbo binding, faster than cv2.imwrite
+except ImportError:
+    simplejpeg = None
+
+# Thinking traces longer than this go to thinking/iter_XXXXX.txt; the JSON logs keep a prefix
+THINKING_SUMMARY_CHARS = 200
+
 
 class Logger:
     """Logs robot execution data for analysis and replay."""
     
-    def __init__(self, log_dir: str = "logs"):
+    def __init__(self, log_dir: str = "logs", jpeg_quality: int = 85, per_iteration_json: bool = False):
         """
         Initialize logger.
         
         Args:
             log_dir: Base directory for logs
+            jpeg_quality: JPEG quality of the saved iteration images
+            per_iteration_json: Also write each iteration to json/iter_XXXXX.json (indented);
+                                events.jsonl always has every iteration, one line each
         """
         self.log_dir = Path(log_dir)
         self.session_dir: Optional[Path] = None
         self.iteration = 0
-        self.log_data: list = []
+        self.per_iteration_json = per_iteration_json
+        self.jpeg_quality = jpeg_quality
+        self._imencode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        # Session's events.jsonl (buffered; appended by log_iteration itself, so a line is
+        # never lost to queue overflow). Iterations are not kept in memory; the summary
+        # uses these running aggregates instead.
+        self._events_file = None
+        self._start_time: Optional[float] = None
+        self._end_time: Optional[float] = None
+        self._failed_actions = 0
+        
+        # Image/thinking/JSON files are written by one background thread so disk I/O
+        # stays off the control loop. Bounded queue: if the disk falls behind, the
+        # oldest pending iteration's files are dropped (its events.jsonl line is kept).
+        self._write_queue: queue.Queue = queue.Queue(maxsize=32)
+        self._dropped = 0
+        self._writer_thread = threading.Thread(target=self._writer_loop, name="logger-writer", daemon=True)
+        self._writer_thread.start()
     
     def start_session(self, task: str = "unknown"):
         """Start a new logging session."""
+        self._close_events()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.session_dir = self.log_dir / f"{timestamp}_{task.replace(' ', '_')}"
         self.session_dir.mkdir(parents=True, exist_ok=True)
         self.iteration = 0
-        self.log_data = []
+        self._start_time = None
+        self._end_time = None
+        self._failed_actions = 0
+        self._dropped = 0
         
         # Create subdirectories
         (self.session_dir / "images").mkdir(exist_ok=True)
-        (self.session_dir / "json").mkdir(exist_ok=True)
+        if self.per_iteration_json:
+            (self.session_dir / "json").mkdir(exist_ok=True)
+        (self.session_dir / "thinking").mkdir(exist_ok=True)
+        self._open_events()
         
         print(f"Logging session started: {self.session_dir}")
     
@@ -50,7 +87,8 @@ class Logger:
                      action_plan: Dict[str, Any],
                      action_result: Optional[Dict[str, Any]] = None,
                      llm_input: Optional[Dict[str, Any]] = None,
-                     llm_output: Optional[Dict[str, Any]] = None):
+                     llm_output: Optional[Dict[str, Any]] = None,
+                     image_bytes: Optional[bytes] = None):
         """
         Log one iteration of execution.
         
@@ -62,6 +100,7 @@ class Logger:
             action_result: Result of executed action
             llm_input: LLM input (if using Gemini)
             llm_output: LLM output (if using Gemini)
+            image_bytes: The frame already JPEG-encoded (written as-is instead of re-encoding)
         """
         if self.session_dir is None:
             self.start_session()
@@ -78,37 +117,140 @@ class Logger:
             "llm_output": llm_output
         }
         
-        # Extract thinking process from action_plan if available
-        if action_plan and "thinking_process" in action_plan:
-            iteration_data["thinking_process"] = action_plan["thinking_process"]
+        # Thinking process: long traces are written to their own text file (in the
+        # background); the JSON logs and the in-memory summary keep only a prefix
+        thinking_path = None
+        thinking = action_plan.get("thinking_process") if action_plan else None
+        if thinking and len(thinking) > THINKING_SUMMARY_CHARS:
+            thinking_path = self.session_dir / "thinking" / f"iter_{self.iteration:05d}.txt"
+            summary = thinking[:THINKING_SUMMARY_CHARS] + "…"
+            action_plan = dict(action_plan, thinking_process=summary)
+            if action_plan.get("why") == thinking:
+                action_plan["why"] = summary
+            iteration_data["action_plan"] = action_plan
+            iteration_data["thinking_process"] = summary
+            iteration_data["thinking_path"] = str(thinking_path.relative_to(self.session_dir))
+        elif action_plan and "thinking_process" in action_plan:
+            iteration_data["thinking_process"] = thinking
         
-        # Save image
+        # Image path (the JPEG itself is encoded and written in the background;
+        # the frame must not be modified after this call)
+        image_path = None
         if image is not None:
             image_path = self.session_dir / "images" / f"iter_{self.iteration:05d}.jpg"
-            cv2.imwrite(str(image_path), image)
             iteration_data["image_path"] = str(image_path.relative_to(self.session_dir))
         
-        # Save JSON
-        json_path = self.session_dir / "json" / f"iter_{self.iteration:05d}.json"
-        with open(json_path, 'w') as f:
-            json.dump(iteration_data, f, indent=2, default=str)
-        
-        # Append to log data
-        self.log_data.append(iteration_data)
+        # One compact line appended to events.jsonl (into its 64 KB buffer, no I/O per call)
+        if self._events_file is None:
+            self._open_events()
+        try:
+            self._events_file.write(
+                json.dumps(iteration_data, default=str, separators=(",", ":")).encode("utf-8") + b"\n"
+            )
+        except Exception as e:
+            print(f"Warning: Failed to append to events.jsonl: {e}")
+        # Files written in the background (JSON serialized now: the dicts may change after this call)
+        json_path = json_text = None
+        if self.per_iteration_json:
+            json_path = self.session_dir / "json" / f"iter_{self.iteration:05d}.json"
+            json_text = json.dumps(iteration_data, indent=2, default=str)
+        self._enqueue((image_path, image_bytes if image_bytes is not None else image,
+                       json_path, json_text, thinking_path, thinking))
         
+        if self._start_time is None:
+            self._start_time = timestamp
+        self._end_time = timestamp
+        if state_summary and state_summary.get("last_action_success") is False:
+            self._failed_actions += 1
         self.iteration += 1
     
+    def _open_events(self):
+        """Open (append to) the session's events.jsonl."""
+        self._events_file = open(self.session_dir / "events.jsonl", "ab", buffering=1 << 16)
+    
+    def _close_events(self):
+        """Write out the queued iterations and close events.jsonl (no-op if not open)."""
+        if self._events_file is None:
+            return
+        if not self.flush():
+            print("Warning: Timed out waiting for iteration logs to be written")
+        try:
+            self._events_file.close()
+        except Exception as e:
+            print(f"Warning: Failed to close events.jsonl: {e}")
+        self._events_file = None
+    
+    def _enqueue(self, item):
+        """Queue a write for the background thread (drops the oldest pending write if full)."""
+        while True:
+            try:
+                self._write_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    dropped = self._write_queue.get_nowait()
+                except queue.Empty:
+                    continue
+                if isinstance(dropped, threading.Event):
+                    dropped.set()  # Never drop a flush marker; release its waiter
+                    continue
+                self._dropped += 1
+                if self._dropped == 1 or self._dropped % 100 == 0:
+                    print(f"Warning: Log writer is behind, dropped the files of {self._dropped} iteration(s)")
+    
+    def _writer_loop(self):
+        """Background thread: write queued iteration files; an Event flushes."""
+        while True:
+            item = self._write_queue.get()
+            if isinstance(item, threading.Event):
+                item.set()  # Flush marker: everything queued before it is written
+                continue
+            image_path, image, json_path, json_text, thinking_path, thinking = item
+            try:
+                if thinking_path is not None:
+                    thinking_path.write_text(thinking, encoding="utf-8")
+                if image_path is not None:
+                    if not isinstance(image, bytes):
+                        image = self._encode_jpeg(image)
+                    # Whole file in one write
+                    image_path.write_bytes(image)
+                if json_path is not None:
+                    with open(json_path, 'w') as f:
+                        f.write(json_text)
+            except Exception as e:
+                print(f"Warning: Failed to write iteration log: {e}")
+    
+    def _encode_jpeg(self, image: np.ndarray) -> bytes:
+        """JPEG-encode a BGR frame (simplejpeg when installed, else OpenCV)."""
+        if simplejpeg is not None and image.ndim == 3 and image.shape[2] == 3 and image.dtype == np.uint8:
+            if not image.flags.c_contiguous:
+                image = np.ascontiguousarray(image)
+            return simplejpeg.encode_jpeg(image, quality=self.jpeg_quality, colorspace='BGR')
+        ok, buffer = cv2.imencode(".jpg", image, self._imencode_params)
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        return buffer.tobytes()
+    
+    def flush(self, timeout_s: float = 10.0) -> bool:
+        """Wait until all queued iteration logs are written. Returns False on timeout."""
+        flushed = threading.Event()
+        self._enqueue(flushed)
+        return flushed.wait(timeout_s)
+    
     def save_summary(self):
-        """Save summary of entire session."""
+        """Save summary of entire session (the iterations themselves are in events.jsonl)."""
         if self.session_dir is None:
             return
+        self._close_events()
         
         summary = {
             "total_iterations": self.iteration,
             "session_dir": str(self.session_dir),
-            "start_time": self.log_data[0]["timestamp"] if self.log_data else None,
-            "end_time": self.log_data[-1]["timestamp"] if self.log_data else None,
-            "iterations": self.log_data
+            "start_time": self._start_time,
+            "end_time": self._end_time,
+            "failed_actions": self._failed_actions,
+            "events": "events.jsonl",
+            "dropped_iteration_files": self._dropped
         }
         
         summary_path = self.session_dir / "summary.json"
@@ -7,6 +7,7 @@ Usage:
 """
 
 import argparse
+import logging
 import sys
 import os
 from dotenv import load_dotenv
@@ -17,7 +18,7 @@ load_dotenv()
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from runtime.executor import Executor
+from runtime.executor import Executor, enable_async_console, iteration_logger
 
 
 def main():
@@ -80,8 +81,76 @@ Examples:
         help="Maximum iterations before timeout (default: 500)"
     )
     
+    parser.add_argument(
+        "--pipeline-observation",
+        action="store_true",
+        help="Capture the next camera frame in the background while the current iteration is logged"
+    )
+    
+    parser.add_argument(
+        "--overlap-completion-check",
+        action="store_true",
+        help="Check task completion concurrently with planning instead of before it"
+    )
+    
+    parser.add_argument(
+        "--camera-reader",
+        action="store_true",
+        help="Keep the camera stream open and read it on a background thread (fresher, faster frames)"
+    )
+    
+    parser.add_argument(
+        "--action-chunk",
+        type=int,
+        default=1,
+        help="Let Gemini plan up to N actions per request and run them without replanning (default: 1)"
+    )
+    
+    parser.add_argument(
+        "--planner-completion",
+        action="store_true",
+        help="Let the planner declare completion (task_complete tool) instead of a separate check each iteration"
+    )
+    
+    parser.add_argument(
+        "--latency-hint",
+        action="store_true",
+        help="Measure the image-to-action latency and include it in the planning prompt"
+    )
+    
+    parser.add_argument(
+        "--per-iteration-json",
+        action="store_true",
+        help="Also write each iteration to its own indented JSON file (json/iter_XXXXX.json)"
+    )
+    
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Do not print the per-iteration trace (detection, action, thinking)"
+    )
+    
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Also print per-call diagnostics (RPC/IK results, arm waits, history image sizes)"
+    )
+    
+    parser.add_argument(
+        "--async-console",
+        action="store_true",
+        help="Print the per-iteration trace from a background thread (for slow terminals, e.g. SSH)"
+    )
+    
     args = parser.parse_args()
     
+    if args.quiet:
+        iteration_logger.setLevel(logging.WARNING)
+    elif args.verbose:
+        iteration_logger.setLevel(logging.DEBUG)
+    if args.async_console:
+        enable_async_console()
+    
     # Check for Gemini API key (required)
     api_key = os.environ.get("GEMINI_API_KEY")
     if not api_key:
@@ -90,12 +159,20 @@ Examples:
         sys.exit(1)
     
     # Create and run executor
+    executor = None
     try:
         executor = Executor(
             robot_ip=args.ip,
             rpc_port=args.rpc_port,
             camera_port=args.camera_port,
-            thresholds_path=args.thresholds
+            thresholds_path=args.thresholds,
+            pipeline_observation=args.pipeline_observation,
+            overlap_completion_check=args.overlap_completion_check,
+            camera_reader=args.camera_reader,
+            action_chunk=args.action_chunk,
+            planner_completion=args.planner_completion,
+            latency_hint=args.latency_hint,
+            per_iteration_json=args.per_iteration_json
         )
         
         executor.run(
@@ -111,6 +188,9 @@ Examples:
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        if executor is not None:
+            executor.close()
 
 
 if __name__ == "__main__":
@@ -11,8 +11,6 @@ import os
 import sys
 from dotenv import load_dotenv
 import numpy as np
-from PIL import Image
-import io
 import cv2
 
 # Load environment variables
@@ -52,16 +50,11 @@ def load_test_image():
 
 
 def image_to_bytes(image: np.ndarray) -> bytes:
-    """Convert numpy image to JPEG bytes."""
-    if len(image.shape) == 3 and image.shape[2] == 3:
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    else:
-        image_rgb = image
-    
-    pil_image = Image.fromarray(image_rgb)
-    buffer = io.BytesIO()
-    pil_image.save(buffer, format="JPEG", quality=85)
-    return buffer.getvalue()
+    """Convert a BGR numpy image to JPEG bytes (OpenCV encodes BGR directly)."""
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buffer.tobytes()
 
 
 def test_robotics_er_model():
@@ -269,13 +262,6 @@ Return your answer in this exact JSON format:
             httpOptions=genai_types.HttpOptions(timeout=120000)  # 120 seconds in milliseconds
         )
         
-        # Prepare contents with image
-        parts = [
-            genai_types.Part.from_text(text=prompt),
-            genai_types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
-        ]
-        contents = [genai_types.Content(parts=parts)]
-        
         print("📤 Sending image request...")
         response = client.models.generate_content(
             model=model_name,